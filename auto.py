@@ -2,17 +2,24 @@
 
 import os
 import http.client
+import socket
+import ssl
 import httplib2
 import os.path
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build, build_from_document
 from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaFileUpload
 from automate.videoText import get_random_title_and_description, get_random_hashtags
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
+from google.auth.credentials import AnonymousCredentials
 import random
 import re
+import json
+import time
+import datetime
+import threading
 
 # Fix the CLIENT_SECRETS_FILE path to use relative path
 CLIENT_SECRETS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "client.json")
@@ -26,12 +33,52 @@ SCOPES = ['https://www.googleapis.com/auth/youtube.upload']
 API_SERVICE_NAME = 'youtube'
 API_VERSION = 'v3'
 
-# The path to the folder containing the video to upload.
-VIDEO_FOLDER_PATH = os.path.join(BASE_DIR, "finalvideos")
+CREDENTIALS_FOLDER = os.path.join(BASE_DIR, "credentials")
 
-def get_authenticated_service(credentials_file_path):
+# Optional local copy of the YouTube discovery document. Without it the copy bundled
+# with google-api-python-client is used, so building a client never hits the network.
+DISCOVERY_DOCUMENT_FILE = os.path.join(BASE_DIR, "youtube_discovery.json")
+
+# Alternative API endpoint, e.g. the local fake server in fakeYoutube.py for offline upload tests.
+# None falls back to 'youtube_api_endpoint' in the config, and to the real API if that is unset too.
+CONFIG_FILE = os.path.join(BASE_DIR, "automation_config.json")
+YOUTUBE_API_ENDPOINT = None
+
+# Cached access tokens are refreshed when they expire within this many seconds
+TOKEN_REFRESH_MARGIN = 300
+
+# Open resumable upload sessions (session URI and confirmed offset per video file),
+# so an interrupted upload continues where it stopped even after a restart
+UPLOAD_SESSIONS_FILE = os.path.join(BASE_DIR, "upload_sessions.json")
+
+# Bytes sent per request. Must be a multiple of 256 KiB; bounds memory use and
+# how much has to be resent after a failed request.
+UPLOAD_CHUNK_SIZE = 32 * 1024 * 1024
+UPLOAD_CHUNK_ALIGNMENT = 256 * 1024
+
+# Retry policy for failed chunks: exponential backoff with full jitter
+UPLOAD_MAX_RETRIES = 10
+UPLOAD_MAX_BACKOFF = 300  # in seconds
+RETRIABLE_STATUS_CODES = (500, 502, 503, 504)
+# Only network failures; OSErrors like a missing or unreadable video file fail at once
+RETRIABLE_EXCEPTIONS = (httplib2.HttpLib2Error, ConnectionError, TimeoutError, socket.timeout, socket.gaierror,
+                        ssl.SSLError, http.client.NotConnected,
+                        http.client.IncompleteRead, http.client.ImproperConnectionState,
+                        http.client.CannotSendRequest, http.client.CannotSendHeader,
+                        http.client.ResponseNotReady, http.client.BadStatusLine)
+# Upload session URIs the server no longer knows, e.g. after they expired
+EXPIRED_SESSION_STATUS_CODES = (404, 410)
+# Error reasons meaning the API project has no quota left for today
+QUOTA_ERROR_REASONS = ('quotaExceeded', 'dailyLimitExceeded', 'uploadLimitExceeded')
+
+class QuotaExceededError(Exception):
+    """Raised when an upload is rejected because the API project or channel ran out of quota"""
+
+upload_sessions_lock = threading.Lock()
+
+def load_credentials(credentials_file_path, client_secrets_file=None):
     """
-    Authenticates the user using a specific credentials file and returns the YouTube API service object.
+    Loads the OAuth credentials of a channel, refreshing or re-authorizing them if needed.
     
     This function first checks for existing valid credentials before requesting new ones.
     """
@@ -60,27 +107,201 @@ def get_authenticated_service(credentials_file_path):
         if not credentials:
             print("🔐 No valid credentials found. Starting OAuth2 flow...")
             try:
-                flow = InstalledAppFlow.from_client_secrets_file(CLIENT_SECRETS_FILE, SCOPES)
+                flow = InstalledAppFlow.from_client_secrets_file(client_secrets_file or CLIENT_SECRETS_FILE, SCOPES)
                 credentials = flow.run_local_server(port=0)
                 print("✅ New credentials obtained successfully!")
             except Exception as e:
                 print(f"❌ OAuth2 flow failed: {e}")
                 raise
         
-        # Save the credentials for the next run
-        try:
-            with open(credentials_file_path, 'w') as token:
-                token.write(credentials.to_json())
-            print(f"💾 Credentials saved to: {credentials_file_path}")
-        except Exception as e:
-            print(f"⚠️  Warning: Could not save credentials: {e}")
+        save_credentials(credentials, credentials_file_path)
     
-    return build(API_SERVICE_NAME, API_VERSION, credentials=credentials)
+    return credentials
+
+def save_credentials(credentials, credentials_file_path):
+    """Saves the credentials for the next run"""
+    try:
+        with open(credentials_file_path, 'w') as token:
+            token.write(credentials.to_json())
+        print(f"💾 Credentials saved to: {credentials_file_path}")
+    except Exception as e:
+        print(f"⚠️  Warning: Could not save credentials: {e}")
+
+def get_api_endpoint():
+    """Returns the configured alternative API endpoint, or None for the real YouTube API"""
+    if YOUTUBE_API_ENDPOINT:
+        return YOUTUBE_API_ENDPOINT
+    try:
+        with open(CONFIG_FILE, 'r') as f:
+            return json.load(f).get("youtube_api_endpoint") or None
+    except Exception:
+        return None
+
+def get_service_credentials(credentials_file_path, client_secrets_file=None):
+    """Channel credentials, or anonymous ones when an alternative endpoint needs no OAuth"""
+    if get_api_endpoint():
+        return AnonymousCredentials()
+    return load_credentials(credentials_file_path, client_secrets_file)
+
+def build_youtube_service(credentials):
+    """Builds the YouTube API client from the local discovery document, never over the network"""
+    api_endpoint = get_api_endpoint()
+    if os.path.exists(DISCOVERY_DOCUMENT_FILE):
+        with open(DISCOVERY_DOCUMENT_FILE, 'r') as f:
+            document = json.load(f)
+    elif api_endpoint:
+        from googleapiclient.discovery_cache import get_static_doc
+        document = json.loads(get_static_doc(API_SERVICE_NAME, API_VERSION))
+    else:
+        return build(API_SERVICE_NAME, API_VERSION, credentials=credentials, static_discovery=True)
+    
+    if api_endpoint:
+        # Upload URLs are derived from rootUrl, so point both it and baseUrl at the endpoint
+        print(f"🧪 Using alternative YouTube API endpoint: {api_endpoint}")
+        document['rootUrl'] = api_endpoint.rstrip('/') + '/'
+        document['baseUrl'] = document['rootUrl'] + document['servicePath']
+    return build_from_document(document, credentials=credentials)
+
+def get_authenticated_service(credentials_file_path):
+    """
+    Authenticates the user using a specific credentials file and returns the YouTube API service object.
+    
+    This function first checks for existing valid credentials before requesting new ones.
+    With an alternative API endpoint configured, no OAuth is done at all.
+    """
+    return build_youtube_service(get_service_credentials(credentials_file_path))
+
+def get_credentials_file_path(channel_name):
+    """Returns the credentials file of a channel, creating the credentials folder if needed"""
+    os.makedirs(CREDENTIALS_FOLDER, exist_ok=True)
+    return os.path.join(CREDENTIALS_FOLDER, f"{channel_name}_credentials.json")
+
+# Built clients per channel. httplib2 connections are not thread-safe, so every
+# thread (e.g. each upload worker) keeps its own clients and connection pools.
+_service_cache = threading.local()
+
+def get_youtube_service(channel_name, credentials_file_path=None, client_secrets_file=None):
+    """Returns a cached YouTube client for the channel, building it on first use.
+
+    The client and its HTTP connections are reused across uploads; the access
+    token is only refreshed once it expires within TOKEN_REFRESH_MARGIN seconds.
+    A channel authorized in several API projects has one client per credentials file.
+    """
+    services = getattr(_service_cache, 'services', None)
+    if services is None:
+        services = _service_cache.services = {}
+    
+    credentials_file_path = credentials_file_path or get_credentials_file_path(channel_name)
+    cache_key = (channel_name, credentials_file_path)
+    cached = services.get(cache_key)
+    if cached is None:
+        credentials = get_service_credentials(credentials_file_path, client_secrets_file)
+        cached = services[cache_key] = (build_youtube_service(credentials), credentials)
+    
+    youtube, credentials = cached
+    # Credentials.expiry is a naive UTC datetime, so compare against naive UTC like google-auth does
+    margin = datetime.timedelta(seconds=TOKEN_REFRESH_MARGIN)
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    if (getattr(credentials, 'refresh_token', None) and credentials.expiry
+            and credentials.expiry - margin <= now):
+        print(f"🔄 Refreshing access token for {channel_name}...")
+        credentials.refresh(Request())
+        save_credentials(credentials, credentials_file_path)
+    return youtube
+
+def clear_service_cache(channel_name=None):
+    """Drops this thread's cached clients, e.g. after the channel's credentials changed"""
+    services = getattr(_service_cache, 'services', None)
+    if services is None:
+        return
+    if channel_name is None:
+        services.clear()
+    else:
+        for cache_key in [key for key in services if key[0] == channel_name]:
+            del services[cache_key]
+
+def get_upload_chunk_size(chunk_size=None):
+    """Rounds the configured chunk size down to a multiple of 256 KiB (at least one block)"""
+    chunk_size = chunk_size or UPLOAD_CHUNK_SIZE
+    return max(UPLOAD_CHUNK_ALIGNMENT, chunk_size // UPLOAD_CHUNK_ALIGNMENT * UPLOAD_CHUNK_ALIGNMENT)
+
+def load_upload_sessions():
+    """Reads the saved upload sessions, keyed by absolute video path"""
+    if not os.path.exists(UPLOAD_SESSIONS_FILE):
+        return {}
+    try:
+        with open(UPLOAD_SESSIONS_FILE, 'r') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"⚠️  Could not read upload sessions: {e}")
+        return {}
+
+def _write_upload_sessions(sessions):
+    # Called with upload_sessions_lock held; replace atomically so a crash never corrupts the file
+    partial_path = f"{UPLOAD_SESSIONS_FILE}.partial"
+    with open(partial_path, 'w') as f:
+        json.dump(sessions, f, indent=2)
+    os.replace(partial_path, UPLOAD_SESSIONS_FILE)
+
+def get_upload_session(video_file_path):
+    """Returns the saved session for a video if the file is unchanged since it started, else None"""
+    with upload_sessions_lock:
+        session = load_upload_sessions().get(os.path.abspath(video_file_path))
+    if not session or not os.path.exists(video_file_path):
+        return None
+    stat = os.stat(video_file_path)
+    if session.get('size') != stat.st_size or session.get('mtime_ns') != stat.st_mtime_ns:
+        return None
+    return session
+
+def save_upload_session(video_file_path, **fields):
+    """Creates or updates the saved session of a video file"""
+    key = os.path.abspath(video_file_path)
+    with upload_sessions_lock:
+        sessions = load_upload_sessions()
+        session = sessions.setdefault(key, {'created_at': time.time()})
+        session.update(fields)
+        session['updated_at'] = time.time()
+        _write_upload_sessions(sessions)
+
+def remove_upload_session(video_file_path):
+    """Forgets the saved session of a video file"""
+    key = os.path.abspath(video_file_path)
+    with upload_sessions_lock:
+        sessions = load_upload_sessions()
+        if sessions.pop(key, None) is not None:
+            _write_upload_sessions(sessions)
+
+def is_quota_error(error):
+    """Tells whether an HttpError reports exhausted quota rather than a broken request"""
+    if error.resp.status not in (403, 429):
+        return False
+    try:
+        errors = json.loads(error.content.decode('utf8'))['error'].get('errors', [])
+    except Exception:
+        return False
+    return any(item.get('reason') in QUOTA_ERROR_REASONS for item in errors)
+
+def upload_video(youtube, video_file_path, title, description, channel_name=None, chunk_size=None, publish_at=None,
+                 shaper=None):
+    """Uploads a video and its metadata to YouTube.
 
-def upload_video(youtube, video_file_path, title, description):
-    """Uploads a video and its metadata to YouTube."""
-    # Get random hashtags for tags
-    tags = get_random_hashtags(30)
+    The upload runs in chunks of chunk_size bytes (UPLOAD_CHUNK_SIZE by default).
+    Its session URI and confirmed offset are saved after every chunk, and a
+    saved session for the same unchanged file is resumed instead of starting over.
+    With publish_at (RFC 3339, UTC) the video stays private and YouTube publishes
+    it at that time. With a BandwidthShaper the upload sends within its share of
+    the shaper's bandwidth budget. Raises QuotaExceededError when the quota is used up.
+    """
+    session = get_upload_session(video_file_path)
+    if session:
+        # Reuse the metadata of the interrupted upload; the server already has it
+        title, description, tags = session['title'], session['description'], session['tags']
+        publish_at = session.get('publish_at')
+        print(f"♻️  Resuming upload of {video_file_path} from byte {session.get('offset', 0)}")
+    else:
+        # Get random hashtags for tags
+        tags = get_random_hashtags(30)
     
     body = {
         'snippet': {
@@ -93,8 +314,11 @@ def upload_video(youtube, video_file_path, title, description):
             'privacyStatus': 'public'
         }
     }
+    if publish_at:
+        # Scheduled publishing requires the video to be private until publishAt
+        body['status'] = {'privacyStatus': 'private', 'publishAt': publish_at}
 
-    media_body = MediaFileUpload(video_file_path, chunksize=-1, resumable=True)
+    media_body = MediaFileUpload(video_file_path, chunksize=get_upload_chunk_size(chunk_size), resumable=True)
 
     try:
         print(f"Uploading file: {video_file_path}")
@@ -103,98 +327,135 @@ def upload_video(youtube, video_file_path, title, description):
             body=body,
             media_body=media_body
         )
+        if session and session.get('resumable_uri'):
+            # Make the client ask the server for the confirmed range before sending more
+            insert_request.resumable_uri = session['resumable_uri']
+            insert_request._in_error_state = True
+        else:
+            stat = os.stat(video_file_path)
+            save_upload_session(video_file_path, channel=channel_name, title=title, description=description,
+                                tags=tags, publish_at=publish_at, size=stat.st_size, mtime_ns=stat.st_mtime_ns,
+                                offset=0, resumable_uri=None)
         
-        response = resumable_upload(insert_request)
+        try:
+            response = resumable_upload(insert_request, video_file_path, shaper=shaper)
+        except HttpError as e:
+            if not session or e.resp.status not in EXPIRED_SESSION_STATUS_CODES:
+                raise
+            # The saved session expired on the server: start a fresh upload of the same file
+            print(f"⚠️  Upload session expired ({e.resp.status}), starting the upload over")
+            remove_upload_session(video_file_path)
+            return upload_video(youtube, video_file_path, title, description, channel_name, chunk_size, publish_at, shaper)
+        
+        if response is None:
+            return None
+        remove_upload_session(video_file_path)
         print("Video upload successful!")
         return response
     except HttpError as e:
+        if is_quota_error(e):
+            remove_upload_session(video_file_path)
+            raise QuotaExceededError(f"Upload quota exceeded ({e.resp.status})") from e
         print(f"An HTTP error {e.resp.status} occurred:\n{e.content}")
         return None
+    except QuotaExceededError:
+        # Raised by the restart of an expired session; the caller rests the API project
+        raise
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
         return None
 
-def resumable_upload(request):
-    """Handles the resumable upload process."""
+def resumable_upload(request, video_file_path=None, max_retries=None, shaper=None):
+    """Handles the resumable upload process.
+
+    Retriable errors are retried with exponential backoff and full jitter; the
+    request then re-syncs with the server's confirmed offset before resending.
+    After every chunk the session URI and offset are saved for video_file_path.
+    Returns None once max_retries consecutive attempts failed; the saved
+    session stays, so a later call can resume it.
+
+    With a shaper, chunks go through a transport paced by the shaper's global
+    and per-upload budgets, and the upload's live throughput is reported. A
+    shaper without budgets is ignored, so the client's own connections are reused.
+    """
+    if shaper is None or not shaper.limited:
+        return _resumable_upload(request, video_file_path, max_retries)
+    name = os.path.basename(video_file_path) if video_file_path else 'upload'
+    with shaper.shaping(name) as upload:
+        return _resumable_upload(request, video_file_path, max_retries, upload, shaper.create_http(upload, request.http))
+
+def _resumable_upload(request, video_file_path, max_retries, upload=None, http=None):
+    max_retries = UPLOAD_MAX_RETRIES if max_retries is None else max_retries
     response = None
+    retry = 0
     while response is None:
+        error = None
         try:
-            status, response = request.next_chunk()
+            status, response = request.next_chunk(http=http)
             if status:
-                print(f"Upload progress: {int(status.progress() * 100)}%")
-        except httplib2.HttpLib2Error as e:
-            print(f"An HTTP error occurred during upload: {e}")
-            break
-        except Exception as e:
-            print(f"An error occurred: {e}")
-            break
+                if upload:
+                    print(f"Upload progress: {int(status.progress() * 100)}% "
+                          f"({upload.get_stats()['throughput_mbps']:.1f} Mbit/s)")
+                else:
+                    print(f"Upload progress: {int(status.progress() * 100)}%")
+                if video_file_path:
+                    save_upload_session(video_file_path, resumable_uri=request.resumable_uri,
+                                        offset=status.resumable_progress)
+            retry = 0
+        except HttpError as e:
+            if e.resp.status not in RETRIABLE_STATUS_CODES:
+                raise
+            error = f"A retriable HTTP error {e.resp.status} occurred"
+        except RETRIABLE_EXCEPTIONS as e:
+            error = f"A retriable error occurred: {e}"
+        
+        if error:
+            retry += 1
+            if retry > max_retries:
+                print(f"❌ {error}. Giving up after {max_retries} retries; the upload can be resumed later.")
+                return None
+            if request.resumable_uri:
+                if video_file_path:
+                    save_upload_session(video_file_path, resumable_uri=request.resumable_uri,
+                                        offset=request.resumable_progress)
+                # Query the server for the bytes it actually received before continuing
+                request._in_error_state = True
+            delay = random.uniform(0, min(UPLOAD_MAX_BACKOFF, 2 ** retry))
+            print(f"⚠️  {error}. Retry {retry}/{max_retries} in {delay:.1f}s...")
+            time.sleep(delay)
     return response
 
-def delete_video(video_file_name):
-    """Deletes the video file from the finalvideos folder."""
-    video_path = os.path.join(VIDEO_FOLDER_PATH, video_file_name)
-    if os.path.exists(video_path):
-        try:
-            os.remove(video_path)
-            print(f"Deleted video file: {video_file_name}")
-        except Exception as e:
-            print(f"Failed to delete video file: {e}")
-    else:
-        print(f"Video file {video_file_name} not found.")
+def upload_video_file(channel_name, video_file_path, credentials_file_path=None, delete_after_upload=True,
+                      publish_at=None, client_secrets_file=None, shaper=None):
+    """Uploads one specific video file to a channel and, unless disabled, deletes it on success.
 
-def get_latest_video_file():
-    """Get the most recent video file from the finalvideos folder."""
-    try:
-        video_files = [f for f in os.listdir(VIDEO_FOLDER_PATH) if f.endswith('.mp4')]
-        if not video_files:
-            return None
-        
-        # Get the most recent file by modification time
-        latest_file = max(video_files, key=lambda f: os.path.getmtime(os.path.join(VIDEO_FOLDER_PATH, f)))
-        return latest_file
-    except Exception as e:
-        print(f"Error finding latest video file: {e}")
+    Returns the uploaded video resource, or None if the upload failed. Raises
+    QuotaExceededError when the API project has no quota left.
+    """
+    if not os.path.exists(video_file_path):
+        print(f"Error: Video file not found at {video_file_path}")
         return None
 
-def automate_process(channel_name):
-    """Function to run the automated upload for a specific channel."""
-    # Find the most recent video file instead of hardcoded name
-    video_file_name = get_latest_video_file()
-    if not video_file_name:
-        print("Error: No video files found in the finalvideos folder")
-        return False
-    
-    video_file_path = os.path.join(VIDEO_FOLDER_PATH, video_file_name)
-    print(f"Found video file: {video_file_name}")
-
     title, description = get_random_title_and_description()
 
-    # Create credentials directory if it doesn't exist
-    credentials_dir = os.path.join(BASE_DIR, "credentials")
-    os.makedirs(credentials_dir, exist_ok=True)
-    credentials_file_path = os.path.join(credentials_dir, f"{channel_name}_credentials.json")
-
     try:
-        youtube = get_authenticated_service(credentials_file_path)
+        youtube = get_youtube_service(channel_name, credentials_file_path, client_secrets_file)
     except Exception as e:
         print(f"Authentication failed: {e}")
-        return False
+        clear_service_cache(channel_name)
+        return None
 
-    if os.path.exists(video_file_path):
-        uploaded_video = upload_video(youtube, video_file_path, title, description)
-        if uploaded_video:
-            print(f"Video uploaded with ID: {uploaded_video['id']}")
-            delete_video(video_file_name)
-            return True
-        else:
-            print("Video upload failed.")
-            return False
+    uploaded_video = upload_video(youtube, video_file_path, title, description, channel_name, publish_at=publish_at,
+                                  shaper=shaper)
+    if uploaded_video:
+        print(f"Video uploaded with ID: {uploaded_video['id']}")
+        if not delete_after_upload:
+            return uploaded_video
+        try:
+            os.remove(video_file_path)
+            print(f"Deleted video file: {os.path.basename(video_file_path)}")
+        except Exception as e:
+            print(f"Failed to delete video file: {e}")
     else:
-        print(f"Error: Video file not found at {video_file_path}")
-        return False
-
-if __name__ == '__main__':
-    # Use the correct channel name
-    channel = "SleepRelaxAndMeditates"
-    print(f"Attempting to automate video upload for channel: {channel}")
-    automate_process(channel)
\ No newline at end of file
+        print("Video upload failed.")
+    return uploaded_video
@@ -0,0 +1,205 @@
+# Filename: automate/bandwidthShaper.py
+
+import time
+import threading
+import collections
+import contextlib
+import urllib.parse
+import httplib2
+import google_auth_httplib2
+
+# Bytes handed to the socket per send: small enough for smooth shaping, large enough to keep syscalls cheap
+SEND_BLOCK_SIZE = 64 * 1024
+# Seconds of sending a bucket may bank while idle, so an upload cannot burst far above its rate
+BUCKET_BURST_SECONDS = 0.25
+# Seconds the live throughput of an upload is averaged over
+THROUGHPUT_WINDOW = 5
+
+def mbps_to_bytes(mbps):
+    """Converts Mbit/s into bytes per second; None or 0 means unlimited"""
+    return mbps * 1000000 / 8 if mbps else None
+
+def bytes_to_mbps(rate):
+    return rate * 8 / 1000000 if rate else None
+
+class TokenBucket:
+    """Token bucket over bytes; a rate of None never blocks.
+
+    Senders reserve their bytes first and sleep off the debt outside the lock,
+    so waiting senders are served in the order they arrived.
+    """
+    def __init__(self, rate=None):
+        self.rate = rate
+        self.tokens = 0
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _capacity(self):
+        return max(self.rate * BUCKET_BURST_SECONDS, SEND_BLOCK_SIZE)
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate:
+            self.tokens = min(self._capacity(), self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def set_rate(self, rate):
+        with self.lock:
+            self._refill()
+            self.rate = rate
+            self.tokens = min(self.tokens, self._capacity()) if rate else 0
+
+    def reserve(self, amount):
+        """Takes amount tokens and returns the seconds to wait before sending them"""
+        with self.lock:
+            self._refill()
+            if not self.rate:
+                return 0
+            self.tokens -= amount
+            return max(0, -self.tokens / self.rate)
+
+class ShapedUpload:
+    """One active upload: its own token bucket and live throughput"""
+    def __init__(self, shaper, name):
+        self.shaper = shaper
+        self.name = name
+        self.bucket = TokenBucket()
+        self.bytes_sent = 0
+        self.started_at = time.monotonic()
+        self.samples = collections.deque()
+        self.lock = threading.Lock()
+
+    def throttle(self, amount):
+        """Blocks until amount bytes fit both this upload's share and the global budget"""
+        delay = max(self.bucket.reserve(amount), self.shaper.global_bucket.reserve(amount))
+        if delay > 0:
+            time.sleep(delay)
+
+    def record(self, amount):
+        now = time.monotonic()
+        with self.lock:
+            self.bytes_sent += amount
+            self.samples.append((now, amount))
+            self._drop_old_samples(now)
+
+    def _drop_old_samples(self, now):
+        while self.samples and self.samples[0][0] < now - THROUGHPUT_WINDOW:
+            self.samples.popleft()
+
+    def get_throughput(self):
+        """Bytes per second sent over the last THROUGHPUT_WINDOW seconds"""
+        now = time.monotonic()
+        with self.lock:
+            self._drop_old_samples(now)
+            elapsed = min(THROUGHPUT_WINDOW, now - self.started_at)
+            return sum(amount for _, amount in self.samples) / elapsed if elapsed > 0 else 0.0
+
+    def get_stats(self):
+        return {
+            'name': self.name,
+            'bytes_sent': self.bytes_sent,
+            'elapsed': time.monotonic() - self.started_at,
+            'throughput_mbps': bytes_to_mbps(self.get_throughput()) or 0.0,
+            'limit_mbps': bytes_to_mbps(self.bucket.rate),
+        }
+
+class ShapedConnectionMixin:
+    """Sends request bodies in blocks, each one paced by the connection's upload"""
+    shaped_upload = None
+
+    def send(self, data):
+        if self.shaped_upload is None or not isinstance(data, (bytes, bytearray, memoryview)):
+            return super().send(data)
+        view = memoryview(data)
+        for start in range(0, len(view), SEND_BLOCK_SIZE):
+            block = view[start:start + SEND_BLOCK_SIZE]
+            self.shaped_upload.throttle(len(block))
+            super().send(block)
+            self.shaped_upload.record(len(block))
+
+class ShapedHttp(httplib2.Http):
+    """httplib2.Http whose connections send at the pace of one ShapedUpload"""
+    def __init__(self, upload, **kwargs):
+        super().__init__(**kwargs)
+        attributes = {'shaped_upload': upload}
+        self.shaped_connection_types = {
+            'http': type('ShapedHTTPConnection', (ShapedConnectionMixin, httplib2.HTTPConnectionWithTimeout), attributes),
+            'https': type('ShapedHTTPSConnection', (ShapedConnectionMixin, httplib2.HTTPSConnectionWithTimeout), attributes),
+        }
+
+    def request(self, uri, method="GET", body=None, headers=None, redirections=httplib2.DEFAULT_MAX_REDIRECTS,
+                connection_type=None):
+        if connection_type is None:
+            connection_type = self.shaped_connection_types.get(urllib.parse.urlsplit(uri).scheme.lower())
+        return super().request(uri, method, body, headers, redirections, connection_type)
+
+class BandwidthShaper:
+    """Shares a global upload bandwidth budget fairly between concurrent uploads.
+
+    A global token bucket caps the bytes all uploads send together. Every
+    active upload has its own bucket, limited to its fair share of the global
+    budget (the budget split evenly between active uploads) and to the
+    per-upload budget, whichever is lower; shares are rebalanced whenever an
+    upload starts or ends. Budgets are in Mbit/s, None means unlimited.
+    """
+    def __init__(self, global_mbps=None, per_upload_mbps=None):
+        self.global_rate = mbps_to_bytes(global_mbps)
+        self.per_upload_rate = mbps_to_bytes(per_upload_mbps)
+        self.global_bucket = TokenBucket(self.global_rate)
+        self.uploads = []
+        self.lock = threading.Lock()
+
+    @property
+    def limited(self):
+        """False when neither budget is set, so uploads can skip the shaped transport entirely"""
+        return bool(self.global_rate or self.per_upload_rate)
+
+    def get_fair_rate(self, active_uploads):
+        """Bytes per second each of active_uploads may send, or None for unlimited"""
+        rates = [self.per_upload_rate]
+        if self.global_rate:
+            rates.append(self.global_rate / max(active_uploads, 1))
+        rates = [rate for rate in rates if rate]
+        return min(rates) if rates else None
+
+    def _rebalance(self):
+        rate = self.get_fair_rate(len(self.uploads))
+        for upload in self.uploads:
+            upload.bucket.set_rate(rate)
+
+    def register(self, name):
+        upload = ShapedUpload(self, name)
+        with self.lock:
+            self.uploads.append(upload)
+            self._rebalance()
+        return upload
+
+    def unregister(self, upload):
+        with self.lock:
+            if upload in self.uploads:
+                self.uploads.remove(upload)
+            self._rebalance()
+
+    @contextlib.contextmanager
+    def shaping(self, name):
+        """Registers an upload for the duration of a with block"""
+        upload = self.register(name)
+        try:
+            yield upload
+        finally:
+            self.unregister(upload)
+
+    def create_http(self, upload, authorized_http=None):
+        """Returns an HTTP transport for upload, keeping the credentials and timeout of an API client's http"""
+        inner_http = getattr(authorized_http, 'http', authorized_http)
+        http = ShapedHttp(upload, timeout=getattr(inner_http, 'timeout', None))
+        credentials = getattr(authorized_http, 'credentials', None)
+        if credentials is None:
+            return http
+        return google_auth_httplib2.AuthorizedHttp(credentials, http=http)
+
+    def get_stats(self):
+        """Live stats of every active upload: name, bytes_sent, elapsed, throughput_mbps and limit_mbps"""
+        with self.lock:
+            uploads = list(self.uploads)
+        return [upload.get_stats() for upload in uploads]
@@ -0,0 +1,328 @@
+import os
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import subprocess
+import datetime
+import threading
+import ffmpeg
+import numpy
+import psutil
+from PIL import Image
+from functions import mixCreate, mediaCache, mediaIndex
+
+# Everything the benchmark creates lives here, away from the real media library
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARK_FOLDER = os.path.join(BASE_DIR, "benchmark")
+DEFAULT_RESULTS_FILE = os.path.join(BENCHMARK_FOLDER, "results.json")
+
+# Synthetic library defaults
+DEFAULT_TRACK_COUNT = 20
+DEFAULT_TRACK_DURATION_RANGE = (120, 300)  # in seconds
+DEFAULT_IMAGE_COUNT = 60
+DEFAULT_IMAGE_SIZE = (3840, 2160)
+DEFAULT_DURATIONS = (60, 300, 900)
+DEFAULT_SEED = 1234
+
+# Relative change beyond which compare flags a metric as regressed
+DEFAULT_REGRESSION_THRESHOLD = 0.10
+SAMPLE_INTERVAL = 0.1  # in seconds
+
+class ResourceSampler:
+    """Samples peak RSS of this process plus its FFmpeg children and peak temp-folder size"""
+    def __init__(self, temp_folder):
+        self.temp_folder = temp_folder
+        self.peak_rss = 0
+        self.peak_temp_bytes = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        process = psutil.Process()
+        while not self.stop_event.is_set():
+            rss = 0
+            for proc in [process] + process.children(recursive=True):
+                try:
+                    rss += proc.memory_info().rss
+                except psutil.Error:
+                    continue
+            self.peak_rss = max(self.peak_rss, rss)
+            self.peak_temp_bytes = max(self.peak_temp_bytes, get_folder_size(self.temp_folder))
+            self.stop_event.wait(SAMPLE_INTERVAL)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop_event.set()
+        self.thread.join()
+
+def get_folder_size(folder_path):
+    """Returns the total size in bytes of the files directly inside a folder"""
+    total = 0
+    try:
+        with os.scandir(folder_path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file():
+                        total += entry.stat().st_size
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return total
+
+def get_tree_size(folder_path):
+    """Returns the total size in bytes of all files below a folder"""
+    total = 0
+    for root, _, files in os.walk(folder_path):
+        for file_name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, file_name))
+            except OSError:
+                continue
+    return total
+
+def build_synthetic_library(track_count=DEFAULT_TRACK_COUNT, image_count=DEFAULT_IMAGE_COUNT,
+                            image_size=DEFAULT_IMAGE_SIZE, seed=DEFAULT_SEED):
+    """Generates a deterministic music and image library offline.
+
+    Tracks are lavfi sine tones of varying pitch and length, images are Pillow
+    renders of seeded noise over a gradient. The library is reused when a previous
+    run already built one with the same parameters.
+    """
+    music_folder = os.path.join(BENCHMARK_FOLDER, "music")
+    images_folder = os.path.join(BENCHMARK_FOLDER, "images")
+    manifest_path = os.path.join(BENCHMARK_FOLDER, "library.json")
+    manifest = {'tracks': track_count, 'images': image_count, 'image_size': list(image_size), 'seed': seed}
+
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as f:
+            if json.load(f) == manifest:
+                print(f"♻️  Reusing synthetic library in {BENCHMARK_FOLDER}")
+                return music_folder, images_folder
+
+    print(f"🧪 Building synthetic library: {track_count} tracks, {image_count} images at {image_size[0]}x{image_size[1]}...")
+    for folder in (music_folder, images_folder):
+        shutil.rmtree(folder, ignore_errors=True)
+        os.makedirs(folder)
+
+    rng = random.Random(seed)
+    for index in range(track_count):
+        duration = rng.randint(*DEFAULT_TRACK_DURATION_RANGE)
+        frequency = rng.randint(110, 880)
+        (
+            ffmpeg
+            .input(f"sine=frequency={frequency}:duration={duration}", format='lavfi')
+            .output(os.path.join(music_folder, f"track_{index:04d}.m4a"), acodec='aac', ab='128k', ac=2)
+            .overwrite_output()
+            .run(cmd=['ffmpeg', '-y'], capture_stderr=True, quiet=True)
+        )
+
+    noise = numpy.random.default_rng(seed)
+    for index in range(image_count):
+        # Vary the aspect ratio a little so letterboxing is exercised
+        width = image_size[0] - rng.randint(0, image_size[0] // 4)
+        height = image_size[1]
+        gradient = numpy.linspace(0, 255, width, dtype=numpy.float32)[None, :, None]
+        pixels = gradient * 0.5 + noise.integers(0, 128, (height, width, 3), dtype=numpy.uint8)
+        Image.fromarray(pixels.clip(0, 255).astype(numpy.uint8), 'RGB').save(
+            os.path.join(images_folder, f"image_{index:04d}.jpg"), 'JPEG', quality=90)
+
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return music_folder, images_folder
+
+def use_benchmark_folders(music_folder, images_folder):
+    """Points the render and cache modules at the benchmark folders"""
+    mixCreate.MUSIC_FOLDER = music_folder
+    mixCreate.IMAGES_FOLDER = images_folder
+    mixCreate.FINAL_VIDEOS_FOLDER = os.path.join(BENCHMARK_FOLDER, "finalvideos")
+    mixCreate.TEMP_FILES_FOLDER = os.path.join(BENCHMARK_FOLDER, "tempFiles")
+
+    cache_folder = os.path.join(BENCHMARK_FOLDER, "cache")
+    # Synthetic images must not enter or evict the real channels' slideshow history
+    mixCreate.SLIDESHOW_HISTORY_FILE = os.path.join(cache_folder, "slideshow_history.json")
+    mediaCache.CACHE_FOLDER = cache_folder
+    mediaCache.AUDIO_CACHE_FOLDER = os.path.join(cache_folder, "audio")
+    mediaCache.IMAGE_CACHE_FOLDER = os.path.join(cache_folder, "images")
+    mediaCache.SEGMENT_CACHE_FOLDER = os.path.join(cache_folder, "segments")
+    mediaIndex.MEDIA_INDEX_FILE = os.path.join(cache_folder, "media_index.db")
+    reset_benchmark_cache()
+
+    for folder in (mixCreate.FINAL_VIDEOS_FOLDER, mixCreate.TEMP_FILES_FOLDER):
+        os.makedirs(folder, exist_ok=True)
+
+def reset_benchmark_cache():
+    """Empties the benchmark cache on disk and in memory for a cold-cache run"""
+    shutil.rmtree(mediaCache.CACHE_FOLDER, ignore_errors=True)
+    mediaCache.probe_cache = mediaCache.FileMetadataCache(os.path.join(mediaCache.CACHE_FOLDER, "probe_cache.json"))
+    mediaCache.content_hash_cache = mediaCache.FileMetadataCache(os.path.join(mediaCache.CACHE_FOLDER, "content_hashes.json"))
+    # The index database went with the folder; forget its schema and the durations it served
+    mediaIndex.reset_state()
+
+def get_benchmark_targets():
+    """Returns (name, callable) pairs; each callable renders `duration` seconds and returns its output path"""
+    def audio_files():
+        return mixCreate.get_supported_files(mixCreate.MUSIC_FOLDER, mixCreate.AUDIO_EXTENSIONS)
+
+    def image_files():
+        return mixCreate.get_supported_files(mixCreate.IMAGES_FOLDER, mixCreate.IMAGE_EXTENSIONS)
+
+    def temp_path(name):
+        return os.path.join(mixCreate.TEMP_FILES_FOLDER, name)
+
+    return [
+        ('create_video_ffmpeg_optimized', lambda duration: mixCreate.create_video_ffmpeg_optimized(duration)),
+        ('create_audio_mix_ffmpeg', lambda duration: mixCreate.create_audio_mix_ffmpeg(
+            audio_files(), duration, temp_path("bench_audio.aac"))),
+        ('create_image_slideshow_ffmpeg', lambda duration: mixCreate.create_image_slideshow_ffmpeg(
+            image_files(), duration, temp_path("bench_slideshow.mp4"))),
+        ('render_video_single_pass_ffmpeg', lambda duration: mixCreate.render_video_single_pass_ffmpeg(
+            audio_files(), image_files(), temp_path("bench_single_pass.mp4"), duration)),
+    ]
+
+def run_benchmark(durations=DEFAULT_DURATIONS, cache_modes=('cold', 'warm'), targets=None, seed=DEFAULT_SEED):
+    """Runs every target at every duration and cache mode and returns the result records"""
+    results = []
+    for name, target in get_benchmark_targets():
+        if targets and name not in targets:
+            continue
+        for duration in durations:
+            for cache_mode in cache_modes:
+                if cache_mode == 'cold':
+                    reset_benchmark_cache()
+                random.seed(seed)
+
+                print(f"⏱️  {name} | {duration}s | {cache_mode} cache")
+                with ResourceSampler(mixCreate.TEMP_FILES_FOLDER) as sampler:
+                    start_time = time.time()
+                    output_path = target(duration)
+                    elapsed = time.time() - start_time
+
+                output_bytes = os.path.getsize(output_path) if output_path and os.path.exists(output_path) else 0
+                mixCreate.cleanup_temp_files([output_path])
+                result = {
+                    'name': name,
+                    'duration': duration,
+                    'cache': cache_mode,
+                    'elapsed_seconds': elapsed,
+                    'video_seconds_per_second': duration / elapsed if elapsed else None,
+                    'peak_rss_bytes': sampler.peak_rss,
+                    'peak_temp_bytes': sampler.peak_temp_bytes,
+                    'output_bytes': output_bytes,
+                    'cache_bytes': get_tree_size(mediaCache.CACHE_FOLDER),
+                }
+                results.append(result)
+                print(f"   {result['video_seconds_per_second']:.2f} s/s, peak RSS {sampler.peak_rss / 1024 ** 2:.0f} MB, "
+                      f"peak temp {sampler.peak_temp_bytes / 1024 ** 2:.1f} MB")
+    return results
+
+def get_ffmpeg_version():
+    """Returns the first line of `ffmpeg -version`, or None if FFmpeg cannot be run"""
+    try:
+        return subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True).stdout.splitlines()[0]
+    except Exception:
+        return None
+
+def write_results(results, results_file, library):
+    """Writes results plus host and library details to a JSON file"""
+    os.makedirs(os.path.dirname(os.path.abspath(results_file)), exist_ok=True)
+    report = {
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'host': {
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'memory_bytes': psutil.virtual_memory().total,
+            'ffmpeg': get_ffmpeg_version(),
+        },
+        'settings': {
+            'encoding_profile': mixCreate.ENCODING_PROFILE,
+            'single_pass_render': mixCreate.SINGLE_PASS_RENDER,
+            'use_audio_cache': mixCreate.USE_AUDIO_CACHE,
+            'use_image_cache': mixCreate.USE_IMAGE_CACHE,
+            'use_segment_cache': mixCreate.USE_SEGMENT_CACHE,
+            'slideshow_workers': mixCreate.SLIDESHOW_WORKERS,
+        },
+        'library': library,
+        'results': results,
+    }
+    with open(results_file, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"💾 Benchmark results written to: {results_file}")
+
+def compare_results(current_file, baseline_file, threshold=DEFAULT_REGRESSION_THRESHOLD):
+    """Compares two results files and returns the list of regressions found.
+
+    Throughput regresses when it drops by more than threshold; peak RSS and peak
+    temp-disk bytes regress when they grow by more than threshold.
+    """
+    with open(current_file, 'r') as f:
+        current = json.load(f)
+    with open(baseline_file, 'r') as f:
+        baseline = json.load(f)
+
+    baseline_results = {(r['name'], r['duration'], r['cache']): r for r in baseline['results']}
+    # (metric, True when higher is better)
+    metrics = [('video_seconds_per_second', True), ('peak_rss_bytes', False), ('peak_temp_bytes', False)]
+    regressions = []
+    for result in current['results']:
+        key = (result['name'], result['duration'], result['cache'])
+        reference = baseline_results.get(key)
+        if not reference:
+            print(f"   {key[0]} | {key[1]}s | {key[2]}: no baseline")
+            continue
+        for metric, higher_is_better in metrics:
+            old, new = reference.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            regressed = change < -threshold if higher_is_better else change > threshold
+            marker = "❌" if regressed else "✅"
+            print(f"   {marker} {key[0]} | {key[1]}s | {key[2]} | {metric}: {old:.4g} -> {new:.4g} ({change:+.1%})")
+            if regressed:
+                regressions.append({'key': key, 'metric': metric, 'baseline': old, 'current': new, 'change': change})
+
+    if regressions:
+        print(f"❌ {len(regressions)} regressions beyond {threshold:.0%}")
+    else:
+        print(f"✅ No regressions beyond {threshold:.0%}")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reproducible render benchmarks on a synthetic media library")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="Build the synthetic library and run the benchmarks")
+    run_parser.add_argument('--durations', type=int, nargs='+', default=list(DEFAULT_DURATIONS), help="Video durations in seconds")
+    run_parser.add_argument('--tracks', type=int, default=DEFAULT_TRACK_COUNT, help="Number of synthetic music tracks")
+    run_parser.add_argument('--images', type=int, default=DEFAULT_IMAGE_COUNT, help="Number of synthetic images")
+    run_parser.add_argument('--image-size', type=int, nargs=2, default=list(DEFAULT_IMAGE_SIZE), metavar=('WIDTH', 'HEIGHT'))
+    run_parser.add_argument('--cache', nargs='+', choices=['cold', 'warm'], default=['cold', 'warm'], help="Cache modes to measure")
+    run_parser.add_argument('--targets', nargs='+', help="Only run these functions")
+    run_parser.add_argument('--profile', choices=list(mixCreate.ENCODING_PROFILES), help="Encoding profile")
+    run_parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    run_parser.add_argument('--output', default=DEFAULT_RESULTS_FILE, help="Results JSON file")
+
+    compare_parser = subparsers.add_parser('compare', help="Flag regressions against a stored baseline")
+    compare_parser.add_argument('current', help="Results JSON file to check")
+    compare_parser.add_argument('baseline', help="Baseline results JSON file")
+    compare_parser.add_argument('--threshold', type=float, default=DEFAULT_REGRESSION_THRESHOLD,
+                                help="Allowed relative change, e.g. 0.1 for 10%%")
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        if args.profile:
+            mixCreate.set_encoding_profile(args.profile)
+        music_folder, images_folder = build_synthetic_library(args.tracks, args.images, tuple(args.image_size), args.seed)
+        use_benchmark_folders(music_folder, images_folder)
+        results = run_benchmark(args.durations, args.cache, args.targets, args.seed)
+        write_results(results, args.output, {'tracks': args.tracks, 'images': args.images,
+                                             'image_size': args.image_size, 'seed': args.seed})
+    else:
+        regressions = compare_results(args.current, args.baseline, args.threshold)
+        raise SystemExit(1 if regressions else 0)
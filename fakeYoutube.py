@@ -0,0 +1,353 @@
+# Filename: automate/fakeYoutube.py
+
+import os
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# Uploads are accepted at the same path the real API uses, relative to the configured endpoint
+UPLOAD_PATH = "/upload/youtube/v3/videos"
+# Bytes read from the socket per step; bandwidth caps are applied per block
+READ_BLOCK_SIZE = 64 * 1024
+# Offsets confirmed after partial acceptance or a disconnect are rounded down to this, like the real API
+UPLOAD_GRANULARITY = 256 * 1024
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+class BandwidthLimiter:
+    """Caps the combined rate of all uploads in bytes per second (0 or None means unlimited)"""
+    def __init__(self, bytes_per_second=None):
+        self.bytes_per_second = bytes_per_second
+        self.available_at = 0
+        self.lock = threading.Lock()
+
+    def consume(self, byte_count):
+        if not self.bytes_per_second:
+            return
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.available_at)
+            self.available_at = start + byte_count / self.bytes_per_second
+            delay = self.available_at - now
+        time.sleep(delay)
+
+class FakeYouTubeServer(ThreadingHTTPServer):
+    """Local stand-in for the videos.insert resumable-upload protocol with fault injection.
+
+    Fault rates are per upload request: error_rate answers with a random 5xx,
+    partial_rate accepts only part of a chunk and answers 308, and
+    disconnect_rate drops the connection mid-chunk. Received bytes are counted,
+    not stored.
+    """
+    daemon_threads = True
+
+    def __init__(self, address=(DEFAULT_HOST, DEFAULT_PORT), bandwidth_mbps=None, latency=0,
+                 error_rate=0, partial_rate=0, disconnect_rate=0, seed=None):
+        super().__init__(address, FakeYouTubeHandler)
+        self.limiter = BandwidthLimiter(bandwidth_mbps * 1000000 / 8 if bandwidth_mbps else None)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.partial_rate = partial_rate
+        self.disconnect_rate = disconnect_rate
+        self.random = random.Random(seed)
+        self.uploads = {}
+        self.lock = threading.Lock()
+        self.stats = {'sessions': 0, 'requests': 0, 'bytes_received': 0, 'completed': 0,
+                      'errors_injected': 0, 'partials_injected': 0, 'disconnects_injected': 0}
+
+    @property
+    def endpoint(self):
+        """Base URL to configure as youtube_api_endpoint"""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def roll(self, rate):
+        with self.lock:
+            return rate > 0 and self.random.random() < rate
+
+    def count(self, key, amount=1):
+        with self.lock:
+            self.stats[key] += amount
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats)
+
+class FakeYouTubeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        # Quiet by default; uploads issue one request per chunk
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, reason, message):
+        self._send_json(status, {'error': {'code': status, 'message': message,
+                                           'errors': [{'reason': reason, 'message': message}]}})
+
+    def _send_incomplete(self, received):
+        # 308 Resume Incomplete; no Range header means nothing was received yet
+        self.send_response(308)
+        if received:
+            self.send_header("Range", f"bytes=0-{received - 1}")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _read_body(self, length, limit=None):
+        """Reads the request body at the capped rate; stops after limit bytes if given"""
+        remaining = length if limit is None else min(length, limit)
+        read = 0
+        while remaining > 0:
+            block = self.rfile.read(min(READ_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            self.server.limiter.consume(len(block))
+            read += len(block)
+            remaining -= len(block)
+        self.server.count('bytes_received', read)
+        return read
+
+    def _wait_latency(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+    def do_POST(self):
+        """Starts a resumable upload session and returns its URI in the Location header"""
+        self._wait_latency()
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        length = int(self.headers.get("Content-Length", 0))
+        metadata = json.loads(self.rfile.read(length) or b"{}")
+        if url.path != UPLOAD_PATH or query.get('uploadType') != ['resumable']:
+            self._send_error(404, 'notFound', f"Unsupported request: POST {url.path}")
+            return
+
+        total = self.headers.get("X-Upload-Content-Length")
+        upload_id = uuid.uuid4().hex
+        with self.server.lock:
+            self.server.uploads[upload_id] = {
+                'total': int(total) if total else None,
+                'received': 0,
+                'metadata': metadata,
+                'resource': None,
+            }
+        self.server.count('sessions')
+        host = self.headers.get("Host") or "%s:%s" % self.server.server_address[:2]
+        location = f"http://{host}{UPLOAD_PATH}?uploadType=resumable&upload_id={upload_id}"
+        self.send_response(200)
+        self.send_header("Location", location)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_PUT(self):
+        """Receives one chunk, or answers a 'bytes */total' status query"""
+        self.server.count('requests')
+        self._wait_latency()
+        query = parse_qs(urlparse(self.path).query)
+        length = int(self.headers.get("Content-Length", 0))
+        upload_id = (query.get('upload_id') or [None])[0]
+        with self.server.lock:
+            upload = self.server.uploads.get(upload_id)
+        if upload is None:
+            self._read_body(length)
+            self._send_error(404, 'notFound', "Upload session not found or expired")
+            return
+
+        content_range = self.headers.get("Content-Range", "")
+        byte_range, _, total = content_range.replace("bytes ", "").partition("/")
+        if total and total != '*':
+            upload['total'] = int(total)
+
+        if upload['resource']:
+            self._read_body(length)
+            self._send_json(200, upload['resource'])
+            return
+
+        if byte_range == '*' or not length:
+            self._send_incomplete(upload['received'])
+            return
+
+        start = int(byte_range.split("-")[0])
+        if start != upload['received']:
+            # Out of sync with the client: tell it what we actually have
+            self._read_body(length)
+            self._send_incomplete(upload['received'])
+            return
+
+        if self.server.roll(self.server.disconnect_rate):
+            self.server.count('disconnects_injected')
+            read = self._read_body(length, self.server.random.randrange(0, max(1, length)))
+            upload['received'] += read // UPLOAD_GRANULARITY * UPLOAD_GRANULARITY
+            # Drop the connection without answering, like a network failure mid-chunk
+            self.close_connection = True
+            self.connection.close()
+            return
+
+        if self.server.roll(self.server.error_rate):
+            self.server.count('errors_injected')
+            self._read_body(length)
+            status = self.server.random.choice((500, 502, 503, 504))
+            self._send_error(status, 'backendError', "Injected server error")
+            return
+
+        read = self._read_body(length)
+        if self.server.roll(self.server.partial_rate) and read > UPLOAD_GRANULARITY:
+            self.server.count('partials_injected')
+            # Any whole number of granules short of the full body, e.g. 256 KiB of a 300 KiB chunk
+            accepted = self.server.random.randint(1, (read - 1) // UPLOAD_GRANULARITY) * UPLOAD_GRANULARITY
+            upload['received'] += accepted
+            self._send_incomplete(upload['received'])
+            return
+
+        upload['received'] += read
+        if upload['total'] is not None and upload['received'] >= upload['total']:
+            metadata = upload['metadata']
+            upload['resource'] = {
+                'kind': 'youtube#video',
+                'id': upload_id[:11],
+                'snippet': metadata.get('snippet', {}),
+                'status': dict(metadata.get('status', {}), uploadStatus='uploaded'),
+            }
+            self.server.count('completed')
+            self._send_json(200, upload['resource'])
+        else:
+            self._send_incomplete(upload['received'])
+
+def start_fake_server(host=DEFAULT_HOST, port=0, **options):
+    """Starts a fake server on a background thread and returns it; port 0 picks a free port"""
+    server = FakeYouTubeServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def run_upload_benchmark(file_size_mb=64, concurrency_levels=(1, 2, 4), chunk_sizes_mb=(8, 32), **server_options):
+    """Uploads synthetic files through auto.py against a fake server for every combination.
+
+    Returns one result dict per (concurrency, chunk size) with wall time,
+    aggregate throughput and the faults the server injected.
+    """
+    from automate import auto
+
+    server = start_fake_server(**server_options)
+    previous_endpoint = auto.YOUTUBE_API_ENDPOINT
+    auto.YOUTUBE_API_ENDPOINT = server.endpoint
+    work_folder = os.path.join(auto.BASE_DIR, "benchmark", "uploads")
+    os.makedirs(work_folder, exist_ok=True)
+    # Benchmark sessions point at the fake server and must never be resumed by real uploads
+    previous_sessions_file = auto.UPLOAD_SESSIONS_FILE
+    auto.UPLOAD_SESSIONS_FILE = os.path.join(work_folder, "upload_sessions.json")
+    results = []
+    try:
+        for concurrency in concurrency_levels:
+            for chunk_size_mb in chunk_sizes_mb:
+                paths = []
+                for index in range(concurrency):
+                    path = os.path.join(work_folder, f"upload_{index}.mp4")
+                    with open(path, 'wb') as f:
+                        f.write(os.urandom(file_size_mb * 1024 * 1024))
+                    paths.append(path)
+
+                stats_before = server.get_stats()
+                outcomes = [None] * concurrency
+                def upload(index):
+                    youtube = auto.get_youtube_service("benchmark")
+                    outcomes[index] = auto.upload_video(youtube, paths[index], "Benchmark upload", "",
+                                                        chunk_size=chunk_size_mb * 1024 * 1024)
+                threads = [threading.Thread(target=upload, args=(index,)) for index in range(concurrency)]
+                start_time = time.time()
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                wall_seconds = time.time() - start_time
+                stats_after = server.get_stats()
+
+                result = {
+                    'concurrency': concurrency,
+                    'chunk_size_mb': chunk_size_mb,
+                    'file_size_mb': file_size_mb,
+                    'succeeded': sum(1 for outcome in outcomes if outcome),
+                    'wall_seconds': wall_seconds,
+                    'throughput_mbps': concurrency * file_size_mb * 8 * 1.048576 / wall_seconds,
+                    **{key: stats_after[key] - stats_before[key] for key in stats_after},
+                }
+                results.append(result)
+                print(f"📤 {concurrency} upload(s) x {file_size_mb} MB, {chunk_size_mb} MB chunks: "
+                      f"{wall_seconds:.2f}s, {result['throughput_mbps']:.1f} Mbit/s, "
+                      f"{result['succeeded']}/{concurrency} succeeded, {result['requests']} requests")
+                for path in paths:
+                    os.remove(path)
+    finally:
+        auto.YOUTUBE_API_ENDPOINT = previous_endpoint
+        if os.path.exists(auto.UPLOAD_SESSIONS_FILE):
+            os.remove(auto.UPLOAD_SESSIONS_FILE)
+        auto.UPLOAD_SESSIONS_FILE = previous_sessions_file
+        server.shutdown()
+        server.server_close()
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local YouTube resumable-upload stand-in for offline upload testing")
+    subparsers = parser.add_subparsers(dest='command')
+
+    def add_fault_arguments(subparser):
+        subparser.add_argument('--bandwidth-mbps', type=float, default=None, help="Combined upload cap in Mbit/s (default: unlimited)")
+        subparser.add_argument('--latency', type=float, default=0, help="Delay before every response, in seconds")
+        subparser.add_argument('--error-rate', type=float, default=0, help="Share of chunks answered with a 5xx")
+        subparser.add_argument('--partial-rate', type=float, default=0, help="Share of chunks only partly accepted (308)")
+        subparser.add_argument('--disconnect-rate', type=float, default=0, help="Share of chunks cut off mid-transfer")
+        subparser.add_argument('--seed', type=int, default=None, help="Seed for reproducible fault injection")
+
+    serve_parser = subparsers.add_parser('serve', help="Run the server; set youtube_api_endpoint in the config to use it")
+    serve_parser.add_argument('--host', default=DEFAULT_HOST)
+    serve_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    add_fault_arguments(serve_parser)
+    bench_parser = subparsers.add_parser('bench', help="Benchmark upload concurrency and chunk sizes against the server")
+    bench_parser.add_argument('--file-size-mb', type=int, default=64)
+    bench_parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4])
+    bench_parser.add_argument('--chunk-size-mb', type=int, nargs='+', default=[8, 32])
+    bench_parser.add_argument('--output', default=None, help="Write the results as JSON to this file")
+    add_fault_arguments(bench_parser)
+    args = parser.parse_args()
+
+    fault_options = {}
+    if args.command:
+        fault_options = {
+            'bandwidth_mbps': args.bandwidth_mbps,
+            'latency': args.latency,
+            'error_rate': args.error_rate,
+            'partial_rate': args.partial_rate,
+            'disconnect_rate': args.disconnect_rate,
+            'seed': args.seed,
+        }
+
+    if args.command == 'bench':
+        results = run_upload_benchmark(args.file_size_mb, args.concurrency, args.chunk_size_mb, **fault_options)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(results, f, indent=2)
+    elif args.command == 'serve':
+        server = FakeYouTubeServer((args.host, args.port), **fault_options)
+        print(f"🧪 Fake YouTube upload server listening on {server.endpoint}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    else:
+        parser.print_help()
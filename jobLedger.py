@@ -0,0 +1,263 @@
+# Filename: automate/jobLedger.py
+
+import os
+import time
+import sqlite3
+import threading
+
+# The ledger lives in the project root next to the config, so it survives restarts
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+JOB_LEDGER_FILE = os.path.join(BASE_DIR, "job_queue.db")
+
+# Every video moves through these states; any active state can also end in FAILED
+PLANNED = 'planned'
+RENDERING = 'rendering'
+RENDERED = 'rendered'
+UPLOADING = 'uploading'
+UPLOADED = 'uploaded'
+CLEANED = 'cleaned'
+FAILED = 'failed'
+
+# Allowed transitions; anything else is a bug or a job touched by two workers
+TRANSITIONS = {
+    PLANNED: (RENDERING, FAILED),
+    RENDERING: (RENDERED, PLANNED, FAILED),
+    RENDERED: (UPLOADING, FAILED),
+    UPLOADING: (UPLOADED, RENDERED, FAILED),
+    UPLOADED: (CLEANED,),
+    CLEANED: (),
+    FAILED: (CLEANED,),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel TEXT NOT NULL,
+    duration INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    video_path TEXT,
+    record TEXT,
+    error TEXT,
+    upload_attempts INTEGER NOT NULL DEFAULT 0,
+    video_id TEXT,
+    publish_at TEXT,
+    not_before REAL,
+    api_project TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs (state, id);
+CREATE INDEX IF NOT EXISTS idx_jobs_state_updated ON jobs (state, updated_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_video_path ON jobs (video_path);
+CREATE TABLE IF NOT EXISTS job_events (
+    job_id INTEGER NOT NULL,
+    from_state TEXT,
+    to_state TEXT NOT NULL,
+    at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_job_events_job ON job_events (job_id);
+"""
+
+class InvalidTransitionError(Exception):
+    """Raised when a job is not in a state the requested transition starts from"""
+
+class JobLedger:
+    """Persistent SQLite ledger tracking every video from plan to cleanup.
+
+    Each state change is an atomic compare-and-set on the job's current state
+    and is appended to job_events, so after a crash the ledger tells exactly
+    which step every video reached.
+    """
+    def __init__(self, ledger_file=JOB_LEDGER_FILE):
+        self.ledger_file = ledger_file
+        self.lock = threading.Lock()
+        connection = self._connect()
+        try:
+            with connection:
+                connection.executescript(SCHEMA)
+        finally:
+            connection.close()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.ledger_file, timeout=30)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        return connection
+
+    def _execute(self, query, params=()):
+        with self.lock:
+            connection = self._connect()
+            try:
+                with connection:
+                    cursor = connection.execute(query, params)
+                    return cursor.lastrowid, [dict(row) for row in cursor.fetchall()]
+            finally:
+                connection.close()
+
+    def _set_state(self, connection, job_id, from_states, to_state, fields):
+        # Called inside a transaction; the WHERE clause makes the transition atomic
+        for from_state in from_states:
+            if to_state not in TRANSITIONS[from_state]:
+                raise InvalidTransitionError(f"{from_state} -> {to_state} is not a valid transition")
+        now = time.time()
+        fields = dict(fields, state=to_state, updated_at=now)
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        placeholders = ", ".join("?" for _ in from_states)
+        row = connection.execute(f"SELECT state FROM jobs WHERE id = ? AND state IN ({placeholders})",
+                                 (job_id, *from_states)).fetchone()
+        if row is None:
+            raise InvalidTransitionError(f"Job {job_id} is not in state {' or '.join(from_states)}")
+        connection.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+        connection.execute("INSERT INTO job_events (job_id, from_state, to_state, at) VALUES (?, ?, ?, ?)",
+                           (job_id, row['state'], to_state, now))
+
+    def plan(self, channel_name, duration):
+        """Records a planned video and returns its job id"""
+        with self.lock:
+            connection = self._connect()
+            try:
+                with connection:
+                    now = time.time()
+                    job_id = connection.execute(
+                        "INSERT INTO jobs (channel, duration, state, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                        (channel_name, duration, PLANNED, now, now)).lastrowid
+                    connection.execute("INSERT INTO job_events (job_id, from_state, to_state, at) VALUES (?, ?, ?, ?)",
+                                       (job_id, None, PLANNED, now))
+                    return job_id
+            finally:
+                connection.close()
+
+    def transition(self, job_id, from_states, to_state, **fields):
+        """Moves a job from one of from_states to to_state, setting extra columns on the way"""
+        if isinstance(from_states, str):
+            from_states = (from_states,)
+        with self.lock:
+            connection = self._connect()
+            try:
+                with connection:
+                    self._set_state(connection, job_id, from_states, to_state, fields)
+            finally:
+                connection.close()
+
+    def claim(self, from_state, to_state, pick=None, assign=None, **fields):
+        """Atomically moves a job in from_state to to_state and returns it, or None.
+
+        Without pick the oldest job is taken. Otherwise pick chooses among the
+        oldest job of every channel, e.g. to share workers fairly between
+        channels, and may return None to take none of them. Jobs whose
+        not_before time lies in the future are left alone. assign is called with
+        the chosen job and returns more columns to set with the transition, or
+        None to leave the job where it is.
+        """
+        ready = "state = ? AND (not_before IS NULL OR not_before <= ?)"
+        with self.lock:
+            connection = self._connect()
+            try:
+                with connection:
+                    now = time.time()
+                    if pick is not None:
+                        rows = connection.execute(
+                            f"SELECT * FROM jobs WHERE id IN (SELECT MIN(id) FROM jobs WHERE {ready} GROUP BY channel)",
+                            (from_state, now)).fetchall()
+                    else:
+                        rows = connection.execute(
+                            f"SELECT * FROM jobs WHERE {ready} ORDER BY id LIMIT 1", (from_state, now)).fetchall()
+                    if not rows:
+                        return None
+                    job = dict(rows[0]) if pick is None else pick([dict(row) for row in rows])
+                    if job is None:
+                        return None
+                    if assign is not None:
+                        assigned = assign(job)
+                        if assigned is None:
+                            return None
+                        fields = dict(fields, **assigned)
+                    self._set_state(connection, job['id'], (from_state,), to_state, fields)
+                    job.update(fields, state=to_state)
+                    return job
+            finally:
+                connection.close()
+
+    def update(self, job_id, **fields):
+        """Sets columns of a job without changing its state"""
+        fields['updated_at'] = time.time()
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        self._execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id):
+        _, rows = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return rows[0] if rows else None
+
+    def count(self, *states):
+        """Counts jobs in any of the given states"""
+        placeholders = ", ".join("?" for _ in states)
+        _, rows = self._execute(f"SELECT COUNT(*) AS n FROM jobs WHERE state IN ({placeholders})", states)
+        return rows[0]['n']
+
+    def find_jobs(self, states, older_than=None, channel_name=None):
+        """Returns jobs in the given states, optionally last changed more than older_than seconds ago.
+
+        Served by the (state, updated_at) index, so finding stale or orphaned
+        videos never scans the video folder.
+        """
+        placeholders = ", ".join("?" for _ in states)
+        query = f"SELECT * FROM jobs WHERE state IN ({placeholders})"
+        params = list(states)
+        if older_than is not None:
+            query += " AND updated_at < ?"
+            params.append(time.time() - older_than)
+        if channel_name is not None:
+            query += " AND channel = ?"
+            params.append(channel_name)
+        _, rows = self._execute(query + " ORDER BY id", params)
+        return rows
+
+    def get_latest_publish_at(self, channel_name):
+        """Returns the latest publishAt (RFC 3339, UTC) assigned to a channel's live jobs, or None"""
+        _, rows = self._execute("SELECT MAX(publish_at) AS publish_at FROM jobs WHERE channel = ? AND state != ?",
+                                (channel_name, FAILED))
+        return rows[0]['publish_at']
+
+    def find_orphaned_videos(self, older_than=0):
+        """Jobs whose video file is still on disk although no step will ever pick it up again"""
+        return [job for job in self.find_jobs((FAILED,), older_than)
+                if job['video_path'] and os.path.exists(job['video_path'])]
+
+    def clean_job(self, job):
+        """Deletes a finished or failed job's video file and marks it cleaned"""
+        video_path = job.get('video_path')
+        if video_path and os.path.exists(video_path):
+            os.remove(video_path)
+            print(f"Deleted video file: {os.path.basename(video_path)}")
+        self.transition(job['id'], (UPLOADED, FAILED), CLEANED)
+
+    def recover(self):
+        """Brings jobs interrupted by a crash or stop back to a resumable state.
+
+        Partial renders are deleted and planned again, interrupted uploads go
+        back to rendered (their saved upload session lets them resume), uploaded
+        videos are cleaned and rendered jobs whose file vanished are failed.
+        Returns the number of jobs that were changed.
+        """
+        changed = 0
+        for job in self.find_jobs((RENDERING,)):
+            if job['video_path'] and os.path.exists(job['video_path']):
+                os.remove(job['video_path'])
+            self.transition(job['id'], RENDERING, PLANNED, video_path=None)
+            changed += 1
+        for job in self.find_jobs((UPLOADING,)):
+            self.transition(job['id'], UPLOADING, RENDERED)
+            changed += 1
+        for job in self.find_jobs((RENDERED,)):
+            if not job['video_path'] or not os.path.exists(job['video_path']):
+                self.transition(job['id'], RENDERED, FAILED, error="video file missing")
+                changed += 1
+        for job in self.find_jobs((UPLOADED,)):
+            try:
+                self.clean_job(job)
+                changed += 1
+            except Exception as e:
+                print(f"Warning: Could not clean up job {job['id']}: {e}")
+        if changed:
+            print(f"♻️  Recovered {changed} interrupted job(s) from the ledger")
+        return changed
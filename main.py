@@ -2,8 +2,12 @@ import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 import os
 import shutil
-from functions.mixCreate import create_video_ffmpeg_optimized
-from automate.auto import automate_process
+from functions.mixCreate import set_encoding_profile, ENCODING_PROFILES
+from automate.pipeline import VideoPipeline
+from automate.jobLedger import JobLedger
+from automate.uploadScheduler import UploadScheduler
+from automate.bandwidthShaper import BandwidthShaper
+from functions.mediaIndex import index_media_files, remove_folder_from_index
 import time
 import threading
 import json
@@ -32,6 +36,9 @@ class AutomationController:
         self.automation_thread = None
         self.cycle_count = 0
         self.start_time = None
+        self.render_metrics = None
+        self.cycle_results = []
+        self.upload_shaper = None
         
     def start(self):
         with self.lock:
@@ -57,11 +64,17 @@ class AutomationController:
             self.paused = False
             logging.info("Automation resumed")
     
-    def update_status(self, status, progress=None):
+    def record_cycle(self, cycle_result):
+        with self.lock:
+            self.cycle_results.append(cycle_result)
+    
+    def update_status(self, status, progress=None, metrics=None):
         with self.lock:
             self.current_status = status
             if progress is not None:
                 self.progress = progress
+            # Live FFmpeg metrics (fps, speed, ETA) only apply while a render stage reports them
+            self.render_metrics = metrics
     
     def get_status(self):
         with self.lock:
@@ -71,7 +84,9 @@ class AutomationController:
                 'status': self.current_status,
                 'progress': self.progress,
                 'cycle_count': self.cycle_count,
-                'start_time': self.start_time
+                'start_time': self.start_time,
+                'render_metrics': self.render_metrics,
+                'uploads': self.upload_shaper.get_stats() if self.upload_shaper else []
             }
 
 class VideoProgressTracker:
@@ -79,13 +94,19 @@ class VideoProgressTracker:
     def __init__(self, controller):
         self.controller = controller
     
-    def update(self, progress, status):
-        self.controller.update_status(status, progress)
+    def update(self, progress, status, metrics=None):
+        self.controller.update_status(status, progress, metrics)
 
 # Global variables
 video_duration = None
 automation_controller = AutomationController()
 
+# Seconds without FFmpeg progress before a render is flagged as stalled in the status bar
+RENDER_STALL_SECONDS = 60
+
+# Structured per-cycle records (render stage resources and upload outcome), one JSON object per line
+CYCLE_METRICS_FILE = "cycle_metrics.jsonl"
+
 # Configuration
 CONFIG_FILE = "automation_config.json"
 DEFAULT_CONFIG = {
@@ -94,6 +115,32 @@ DEFAULT_CONFIG = {
     "max_cycles": 10,
     "auto_cleanup": True,
     "file_size_limit_mb": 100,
+    "encoding_profile": "default",
+    "uplink_mbps": 20,
+    "render_workers": 1,
+    "upload_workers": 1,
+    # Rendered videos that may wait for an upload before renders pause. Videos held back by the
+    # upload_window or by exhausted quota do not count, so renders build a backlog for the next window.
+    "max_pending_uploads": 2,
+    # Alternative upload endpoint, e.g. "http://127.0.0.1:8765/" for the local fake server (None = YouTube)
+    "youtube_api_endpoint": None,
+    # Multi-channel mode: one section per channel, e.g. {"name": "...", "video_duration": 3600,
+    # "max_videos": 5, "cycle_delay": 600, "weight": 1, "music_folder": "...", "images_folder": "...",
+    # "credentials_file": "...", "publish_times": ["08:00", "18:00"], "api_projects": ["..."]}.
+    # Empty means the single channel_name above.
+    "channels": [],
+    # Publish slots (local "HH:MM") for channels without their own; empty publishes right after upload
+    "publish_times": [],
+    # API projects uploads are spread over by daily quota, e.g. {"name": "second", "client_secrets_file":
+    # "client2.json", "daily_quota": 10000}. Empty means client.json with the default quota.
+    "api_projects": [],
+    "upload_quota_cost": 1600,
+    # Off-peak upload window in local time, e.g. ["01:00", "07:00"] (None = any time)
+    "upload_window": None,
+    # Upload bandwidth budgets in Mbit/s (None = unlimited). The global budget is shared fairly by all
+    # concurrent uploads; keep it below uplink_mbps so the rest of the host keeps some uplink.
+    "upload_bandwidth_mbps": None,
+    "upload_bandwidth_per_upload_mbps": None,
     "supported_image_formats": [".jpg", ".jpeg", ".png", ".gif", ".bmp", ".tiff", ".webp"],
     "supported_audio_formats": [".mp3", ".wav", ".m4a", ".aac", ".flac", ".ogg"]
 }
@@ -188,16 +235,17 @@ def start_automation():
         
         # Check if media files exist
         config = load_config()
-        music_folder = os.path.join(os.getcwd(), "music")
-        images_folder = os.path.join(os.getcwd(), "images")
-        
-        if not os.path.exists(music_folder) or not os.listdir(music_folder):
-            messagebox.showerror("No Music", "Please upload some music files first.")
-            return
-        
-        if not os.path.exists(images_folder) or not os.listdir(images_folder):
-            messagebox.showerror("No Images", "Please upload some image files first.")
-            return
+        for channel in get_channel_configs(config):
+            music_folder = channel.get("music_folder") or os.path.join(os.getcwd(), "music")
+            images_folder = channel.get("images_folder") or os.path.join(os.getcwd(), "images")
+            
+            if not os.path.exists(music_folder) or not os.listdir(music_folder):
+                messagebox.showerror("No Music", f"Please upload some music files first ({channel['name']}).")
+                return
+            
+            if not os.path.exists(images_folder) or not os.listdir(images_folder):
+                messagebox.showerror("No Images", f"Please upload some image files first ({channel['name']}).")
+                return
         
         # Start automation
         automation_controller.start()
@@ -205,7 +253,6 @@ def start_automation():
         
         automation_thread = threading.Thread(
             target=start_video_generation_and_automation, 
-            args=(config["channel_name"],),
             daemon=True
         )
         automation_thread.start()
@@ -232,63 +279,98 @@ def resume_automation():
     automation_controller.resume()
     update_ui_state()
 
-def start_video_generation_and_automation(channel_name):
-    """Controlled video generation and automation process"""
+def emit_cycle_record(cycle_result):
+    """Logs a cycle record as JSON and appends it to the cycle metrics file"""
+    record = json.dumps(cycle_result)
+    logging.info(f"Cycle record: {record}")
+    try:
+        with open(CYCLE_METRICS_FILE, 'a') as f:
+            f.write(record + "\n")
+    except Exception as e:
+        logging.warning(f"Could not write cycle record: {e}")
+
+def get_channel_configs(config):
+    """Returns the enabled channel sections, or the single configured channel.
+
+    Channels without their own video_duration, max_videos or cycle_delay use the
+    duration entered in the GUI and the global max_cycles and cycle_delay.
+    """
+    channels = [channel for channel in config.get("channels") or [] if channel.get("enabled", True)]
+    if not channels:
+        channels = [{"name": config["channel_name"]}]
+    return [
+        {
+            "video_duration": video_duration,
+            "max_videos": config.get("max_cycles", 10),
+            "cycle_delay": config.get("cycle_delay", 30),
+            "publish_times": config.get("publish_times") or [],
+            **{key: value for key, value in channel.items() if key != "enabled"},
+        }
+        for channel in channels
+    ]
+
+def record_pipeline_job(cycle_result):
+    """Stores and emits the record of a job the pipeline finished"""
+    automation_controller.record_cycle(cycle_result)
+    emit_cycle_record(cycle_result)
+    if cycle_result.get('render_error'):
+        logging.error(f"Render of job {cycle_result['job']} failed: {cycle_result['render_error']}")
+    elif cycle_result.get('upload_success'):
+        automation_controller.update_status("Cycle completed", 100)
+        logging.info(f"Job {cycle_result['job']} completed successfully")
+    else:
+        logging.error(f"Upload of job {cycle_result['job']} failed")
+        messagebox.showwarning("Automation Warning", f"Job {cycle_result['job']} failed to upload. Check logs for details.")
+
+def start_video_generation_and_automation():
+    """Runs the render/upload pipeline until every channel's videos are done or automation stops.
+
+    Render and upload workers run concurrently, so a video uploads while the
+    next one renders, and all configured channels share the same workers. The
+    job queue on disk lets unfinished uploads continue after a restart.
+    """
     config = load_config()
-    max_cycles = config.get("max_cycles", 10)
-    cycle_delay = config.get("cycle_delay", 30)
     
     try:
-        while automation_controller.running and automation_controller.cycle_count < max_cycles:
-            if automation_controller.paused:
-                automation_controller.update_status("Paused", 0)
-                time.sleep(1)
-                continue
-            
-            automation_controller.update_status("Starting cycle...", 10)
-            automation_controller.cycle_count += 1
-            
-            logging.info(f"Starting cycle {automation_controller.cycle_count}/{max_cycles}")
-            
-            # Check if still running after status update
-            if not automation_controller.running:
-                break
-            
-            automation_controller.update_status("Creating video...", 20)
-            logging.info(f"Generating video for channel '{channel_name}' with duration {video_duration} seconds")
-            
-            # Create video with progress tracking
-            progress_tracker = VideoProgressTracker(automation_controller)
-            create_video_ffmpeg_optimized(video_duration, progress_tracker)
-            
-            if not automation_controller.running:
-                break
-            
-            automation_controller.update_status("Starting automation...", 80)
-            logging.info("Starting automation tasks...")
-            success = automate_process(channel_name)
-            
-            if success:
-                automation_controller.update_status("Cycle completed", 100)
-                logging.info(f"Cycle {automation_controller.cycle_count} completed successfully")
-            else:
-                automation_controller.update_status("Automation failed", 0)
-                logging.error(f"Cycle {automation_controller.cycle_count} failed")
-                messagebox.showwarning("Automation Warning", f"Cycle {automation_controller.cycle_count} failed. Check logs for details.")
-            
-            if not automation_controller.running:
-                break
-            
-            # Wait before next cycle
-            automation_controller.update_status(f"Waiting {cycle_delay}s before next cycle...", 0)
-            for i in range(cycle_delay):
-                if not automation_controller.running:
-                    break
-                time.sleep(1)
+        set_encoding_profile(config.get("encoding_profile", "default"))
+        channels = get_channel_configs(config)
+        max_cycles = sum(channel["max_videos"] for channel in channels)
+        
+        automation_controller.update_status("Starting pipeline...", 10)
+        logging.info(f"Starting pipeline for {len(channels)} channel(s) "
+                     f"({', '.join(channel['name'] for channel in channels)}): {max_cycles} videos, "
+                     f"{config.get('render_workers', 1)} render and {config.get('upload_workers', 1)} upload workers")
+        
+        ledger = JobLedger()
+        scheduler = UploadScheduler(
+            config.get("api_projects"),
+            channels,
+            insert_cost=config.get("upload_quota_cost", 1600),
+            upload_window=config.get("upload_window"),
+            ledger=ledger
+        )
+        # Without a budget uploads keep the cached clients' own connections, unshaped
+        upload_budgets = (config.get("upload_bandwidth_mbps"), config.get("upload_bandwidth_per_upload_mbps"))
+        automation_controller.upload_shaper = BandwidthShaper(*upload_budgets) if any(upload_budgets) else None
+        
+        pipeline = VideoPipeline(
+            automation_controller,
+            channels,
+            progress_tracker=VideoProgressTracker(automation_controller),
+            render_workers=config.get("render_workers", 1),
+            upload_workers=config.get("upload_workers", 1),
+            max_pending_uploads=config.get("max_pending_uploads", 2),
+            on_record=record_pipeline_job,
+            ledger=ledger,
+            scheduler=scheduler,
+            shaper=automation_controller.upload_shaper
+        )
+        results = pipeline.run()
         
-        if automation_controller.cycle_count >= max_cycles:
+        if automation_controller.running and automation_controller.cycle_count >= max_cycles:
+            uploaded = sum(1 for result in results if result.get('upload_success'))
             automation_controller.update_status("Maximum cycles reached", 100)
-            logging.info(f"Automation completed after {max_cycles} cycles")
+            logging.info(f"Automation completed after {max_cycles} cycles ({uploaded} uploaded)")
             messagebox.showinfo("Automation Complete", f"Automation completed after {max_cycles} cycles.")
         
         automation_controller.stop()
@@ -327,10 +409,24 @@ def update_ui_state():
             elapsed = datetime.now() - status['start_time']
             status_text += f" | Elapsed: {str(elapsed).split('.')[0]}"
     
+    metrics = status['render_metrics']
+    if status['running'] and metrics:
+        stalled_for = time.time() - metrics['updated_at']
+        if stalled_for > RENDER_STALL_SECONDS:
+            status_text += f" | ⚠️ No FFmpeg progress for {int(stalled_for)}s"
+    
+    if status['running'] and status['uploads']:
+        status_text += " | Uploads: " + ", ".join(
+            f"{upload['name']} {upload['throughput_mbps']:.1f} Mbit/s" for upload in status['uploads'])
+    
     status_label.config(text=status_text)
     
-    # Update progress bar
-    if status['running'] and not status['paused']:
+    # Update progress bar: real percent while FFmpeg reports progress, busy animation otherwise
+    if status['running'] and not status['paused'] and metrics:
+        progress_bar.stop()
+        progress_bar.config(mode='determinate', value=status['progress'])
+    elif status['running'] and not status['paused']:
+        progress_bar.config(mode='indeterminate')
         progress_bar.start()
     else:
         progress_bar.stop()
@@ -355,6 +451,7 @@ def upload_images():
     
     successful_uploads = 0
     failed_uploads = 0
+    uploaded_paths = []
     
     for file_path in file_paths:
         try:
@@ -369,6 +466,7 @@ def upload_images():
             filename = os.path.basename(file_path)
             dest_path = os.path.join(images_folder, filename)
             shutil.copy2(file_path, dest_path)
+            uploaded_paths.append(dest_path)
             successful_uploads += 1
             logging.info(f"Image uploaded: {filename}")
             
@@ -376,6 +474,8 @@ def upload_images():
             logging.error(f"Failed to upload {os.path.basename(file_path)}: {e}")
             failed_uploads += 1
     
+    index_uploaded_files(uploaded_paths, 'image')
+    
     # Show results
     if successful_uploads > 0:
         messagebox.showinfo("Upload Complete", 
@@ -400,6 +500,7 @@ def upload_music():
     
     successful_uploads = 0
     failed_uploads = 0
+    uploaded_paths = []
     
     for file_path in file_paths:
         try:
@@ -414,6 +515,7 @@ def upload_music():
             filename = os.path.basename(file_path)
             dest_path = os.path.join(music_folder, filename)
             shutil.copy2(file_path, dest_path)
+            uploaded_paths.append(dest_path)
             successful_uploads += 1
             logging.info(f"Music uploaded: {filename}")
             
@@ -421,6 +523,8 @@ def upload_music():
             logging.error(f"Failed to upload {os.path.basename(file_path)}: {e}")
             failed_uploads += 1
     
+    index_uploaded_files(uploaded_paths, 'audio')
+    
     # Show results
     if successful_uploads > 0:
         messagebox.showinfo("Upload Complete", 
@@ -429,6 +533,18 @@ def upload_music():
         messagebox.showwarning("Upload Issues", 
                              f"{failed_uploads} files failed to upload. Check logs for details.")
 
+def index_uploaded_files(file_paths, kind):
+    """Adds freshly uploaded media to the media index in the background"""
+    def worker():
+        try:
+            count = index_media_files(file_paths, kind)
+            logging.info(f"Indexed {count} uploaded {kind} files")
+        except Exception as e:
+            logging.warning(f"Could not index uploaded {kind} files: {e}")
+    
+    if file_paths:
+        threading.Thread(target=worker, daemon=True).start()
+
 def delete_all_images():
     """Delete all images with confirmation"""
     if not messagebox.askyesno("Confirm Delete", "Are you sure you want to delete ALL images?"):
@@ -458,6 +574,7 @@ def delete_folder_contents(folder_path, item_name):
                 if os.path.isfile(file_path):
                     os.remove(file_path)
                     logging.info(f"Deleted {item_name}: {file_name}")
+            remove_folder_from_index(folder_path)
         return True
     except Exception as e:
         logging.error(f"Failed to delete {item_name}: {e}")
@@ -496,6 +613,12 @@ def open_settings():
     size_entry.insert(0, str(config["file_size_limit_mb"]))
     size_entry.grid(row=3, column=1, pady=5, padx=5)
     
+    # Encoding profile
+    tk.Label(settings_window, text="Encoding Profile:", bg='#f2f2f2').grid(row=4, column=0, pady=5, padx=5)
+    profile_combo = ttk.Combobox(settings_window, values=list(ENCODING_PROFILES), state='readonly', width=27)
+    profile_combo.set(config["encoding_profile"])
+    profile_combo.grid(row=4, column=1, pady=5, padx=5)
+    
     def save_settings():
         try:
             new_config = config.copy()
@@ -503,6 +626,7 @@ def open_settings():
             new_config["cycle_delay"] = int(delay_entry.get())
             new_config["max_cycles"] = int(cycles_entry.get())
             new_config["file_size_limit_mb"] = int(size_entry.get())
+            new_config["encoding_profile"] = profile_combo.get()
             
             save_config(new_config)
             messagebox.showinfo("Success", "Settings saved successfully!")
@@ -512,7 +636,7 @@ def open_settings():
     
     # Save button
     tk.Button(settings_window, text="Save Settings", command=save_settings, 
-              bg="#4CAF50", fg="white", font=("Helvetica", 10, "bold")).grid(row=4, column=0, columnspan=2, pady=20)
+              bg="#4CAF50", fg="white", font=("Helvetica", 10, "bold")).grid(row=5, column=0, columnspan=2, pady=20)
 
 def show_system_info():
     """Display system information and resource usage"""
@@ -548,6 +672,13 @@ def cleanup_temp_files():
                     os.remove(file_path)
                     logging.info(f"Cleaned up temp file: {file_name}")
         
+        # Videos of failed jobs come from an indexed ledger query, not a scan of finalvideos
+        if not automation_controller.running:
+            ledger = JobLedger()
+            for job in ledger.find_orphaned_videos():
+                ledger.clean_job(job)
+                logging.info(f"Cleaned up orphaned video of job {job['id']}: {job['video_path']}")
+        
         messagebox.showinfo("Cleanup Complete", "Temporary files cleaned up successfully!")
     except Exception as e:
         messagebox.showerror("Error", f"Cleanup failed: {e}")
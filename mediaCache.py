@@ -0,0 +1,435 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import ffmpeg
+from PIL import Image, ImageOps
+
+# Cross-platform cache paths, relative to the project root like the other media folders
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_FOLDER = os.path.join(BASE_DIR, "cache")
+AUDIO_CACHE_FOLDER = os.path.join(CACHE_FOLDER, "audio")
+IMAGE_CACHE_FOLDER = os.path.join(CACHE_FOLDER, "images")
+SEGMENT_CACHE_FOLDER = os.path.join(CACHE_FOLDER, "segments")
+PROBE_CACHE_FILE = os.path.join(CACHE_FOLDER, "probe_cache.json")
+CONTENT_HASH_CACHE_FILE = os.path.join(CACHE_FOLDER, "content_hashes.json")
+
+# Canonical format every cached track is transcoded to, so renders can stream-copy them
+NORMALIZED_AUDIO_CODEC = 'aac'
+NORMALIZED_AUDIO_CHANNELS = 2
+NORMALIZED_AUDIO_EXTENSION = '.m4a'
+NORMALIZED_IMAGE_EXTENSION = '.jpg'
+NORMALIZED_IMAGE_QUALITY = 95
+
+# Cache entries younger than this survive a prune, so renders running concurrently keep what they just wrote
+CACHE_PRUNE_GRACE_SECONDS = 24 * 3600
+
+def get_file_signature(file_path):
+    """Returns (size, mtime_ns) used to detect changed source files"""
+    stat = os.stat(file_path)
+    return stat.st_size, stat.st_mtime_ns
+
+def get_partial_path(cached_path):
+    """Returns a unique temporary name next to a cache entry, keeping its extension.
+
+    Writers produce the entry under this name and rename it into place, so a crash
+    never leaves a truncated entry and concurrent renders never share a temp file.
+    """
+    root, extension = os.path.splitext(cached_path)
+    return f"{root}.{uuid.uuid4().hex}.partial{extension}"
+
+class FileMetadataCache:
+    """Thread-safe on-disk cache of per-file metadata invalidated by size and mtime"""
+    def __init__(self, cache_file):
+        self.cache_file = cache_file
+        self.entries = None
+        self.dirty = False
+        self.lock = threading.Lock()
+
+    def _load(self):
+        # Called with the lock held; the JSON file is read once per process
+        if self.entries is not None:
+            return
+        self.entries = {}
+        if os.path.exists(self.cache_file):
+            try:
+                with open(self.cache_file, 'r') as f:
+                    self.entries = json.load(f)
+            except Exception as e:
+                print(f"Warning: Could not read cache {self.cache_file}, starting empty: {e}")
+
+    def get(self, file_path):
+        """Returns cached data for a file, or None if missing or the file changed"""
+        key = os.path.abspath(file_path)
+        size, mtime_ns = get_file_signature(file_path)
+        with self.lock:
+            self._load()
+            entry = self.entries.get(key)
+        if entry and entry['size'] == size and entry['mtime_ns'] == mtime_ns:
+            return entry['data']
+        return None
+
+    def set(self, file_path, data):
+        size, mtime_ns = get_file_signature(file_path)
+        with self.lock:
+            self._load()
+            self.entries[os.path.abspath(file_path)] = {'size': size, 'mtime_ns': mtime_ns, 'data': data}
+            self.dirty = True
+
+    def save(self):
+        """Writes the cache back to disk if anything changed"""
+        with self.lock:
+            if not self.dirty:
+                return
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            partial_path = f"{self.cache_file}.partial"
+            with open(partial_path, 'w') as f:
+                json.dump(self.entries, f)
+            os.replace(partial_path, self.cache_file)
+            self.dirty = False
+
+probe_cache = FileMetadataCache(PROBE_CACHE_FILE)
+content_hash_cache = FileMetadataCache(CONTENT_HASH_CACHE_FILE)
+
+def get_content_hash(file_path, save=True):
+    """Returns the SHA-1 of a file's content, re-hashing only when size or mtime change"""
+    digest = content_hash_cache.get(file_path)
+    if digest is not None:
+        return digest
+
+    sha1 = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha1.update(block)
+    digest = sha1.hexdigest()
+    content_hash_cache.set(file_path, digest)
+    if save:
+        content_hash_cache.save()
+    return digest
+
+def probe_media(file_path, save=True):
+    """Returns duration, codec, sample rate, channels and dimensions of a media file.
+
+    Results are served from the on-disk probe cache and ffprobe only runs for
+    files that are new or changed since they were last probed.
+    """
+    info = probe_cache.get(file_path)
+    if info is not None:
+        return info
+
+    probe = ffmpeg.probe(file_path)
+    streams = probe.get('streams', [])
+    audio = next((stream for stream in streams if stream.get('codec_type') == 'audio'), {})
+    video = next((stream for stream in streams if stream.get('codec_type') == 'video'), {})
+    duration = probe.get('format', {}).get('duration')
+    info = {
+        'duration': float(duration) if duration is not None else None,
+        'codec': audio.get('codec_name') or video.get('codec_name'),
+        'sample_rate': int(audio['sample_rate']) if audio.get('sample_rate') else None,
+        'channels': audio.get('channels'),
+        'width': video.get('width'),
+        'height': video.get('height'),
+    }
+    probe_cache.set(file_path, info)
+    if save:
+        probe_cache.save()
+    return info
+
+def get_media_duration(file_path):
+    """Returns the duration of a media file in seconds using the probe cache"""
+    duration = probe_media(file_path)['duration']
+    if duration is None:
+        raise ValueError(f"No duration reported for {file_path}")
+    return duration
+
+def warm_probe_cache(file_paths, max_workers=None):
+    """Probes every file that is not cached yet in parallel and saves the cache once.
+
+    Files that vanished since they were listed are skipped. Returns a (probed,
+    failed) tuple of counts.
+    """
+    missing = []
+    for file_path in file_paths:
+        try:
+            if probe_cache.get(file_path) is None:
+                missing.append(file_path)
+        except FileNotFoundError:
+            print(f"Warning: Skipping {file_path}, it no longer exists")
+    probed = 0
+    failed = 0
+    if missing:
+        print(f"🔍 Probing {len(missing)} of {len(file_paths)} media files...")
+        with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+            futures = {executor.submit(probe_media, file_path, False): file_path for file_path in missing}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                    probed += 1
+                except Exception as e:
+                    print(f"Warning: Failed to probe {futures[future]}: {e}")
+                    failed += 1
+        probe_cache.save()
+    return probed, failed
+
+def get_normalized_audio_path(source_path, bitrate, sample_rate):
+    """Returns the cache path for a source track in the canonical audio format.
+
+    The key covers the source path, size and mtime plus the target format, so an
+    edited track or a changed bitrate simply maps to a new cache entry.
+    """
+    size, mtime_ns = get_file_signature(source_path)
+    key = "|".join([
+        os.path.abspath(source_path), str(size), str(mtime_ns),
+        NORMALIZED_AUDIO_CODEC, str(sample_rate), str(NORMALIZED_AUDIO_CHANNELS), str(bitrate),
+    ])
+    digest = hashlib.sha1(key.encode('utf8')).hexdigest()
+    return os.path.join(AUDIO_CACHE_FOLDER, f"{digest}{NORMALIZED_AUDIO_EXTENSION}")
+
+def normalize_audio_track(source_path, bitrate, sample_rate, session=None):
+    """Transcodes a track into the audio cache once and returns the cached path.
+
+    With a render session the transcode is cancellable and reports its
+    progress and resources as the 'audio_cache' stage.
+    """
+    # Imported here because mixCreate imports this module
+    from functions.mixCreate import run_ffmpeg
+
+    cached_path = get_normalized_audio_path(source_path, bitrate, sample_rate)
+    if os.path.exists(cached_path) and os.path.getsize(cached_path) > 0:
+        return cached_path
+
+    os.makedirs(AUDIO_CACHE_FOLDER, exist_ok=True)
+    partial_path = get_partial_path(cached_path)
+    try:
+        run_ffmpeg(
+            ffmpeg
+            .input(source_path)
+            .output(partial_path, vn=None, acodec=NORMALIZED_AUDIO_CODEC, ar=sample_rate,
+                    ac=NORMALIZED_AUDIO_CHANNELS, ab=bitrate)
+            .overwrite_output(),
+            session, 'audio_cache', probe_media(source_path, save=False)['duration']
+        )
+        os.replace(partial_path, cached_path)
+    except Exception:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+
+    print(f"🎵 Cached normalized audio: {os.path.basename(source_path)} -> {cached_path}")
+    return cached_path
+
+def normalize_audio_tracks(source_paths, bitrate, sample_rate, max_workers=None, session=None):
+    """Makes sure every track has a cache entry, transcoding missing ones in parallel.
+
+    Returns a dict mapping each source path to its cached path. Raises the first
+    transcoding error so callers can fall back to re-encoding.
+    """
+    cached = {}
+    missing = []
+    for source_path in dict.fromkeys(source_paths):
+        cached_path = get_normalized_audio_path(source_path, bitrate, sample_rate)
+        if os.path.exists(cached_path) and os.path.getsize(cached_path) > 0:
+            cached[source_path] = cached_path
+        else:
+            missing.append(source_path)
+
+    if missing:
+        print(f"🎵 Normalizing {len(missing)} audio tracks into the cache...")
+        with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+            futures = {
+                executor.submit(normalize_audio_track, source_path, bitrate, sample_rate, session): source_path
+                for source_path in missing
+            }
+            for future in as_completed(futures):
+                cached[futures[future]] = future.result()
+
+    return cached
+
+def get_normalized_image_path(source_path, resolution, save=True):
+    """Returns the content-addressed cache path of an image letterboxed to resolution"""
+    digest = get_content_hash(source_path, save)
+    return os.path.join(IMAGE_CACHE_FOLDER, f"{digest}_{resolution[0]}x{resolution[1]}{NORMALIZED_IMAGE_EXTENSION}")
+
+def normalize_image(source_path, resolution, save=True):
+    """Scales an image to fit resolution, pads it with black bars and caches the result"""
+    cached_path = get_normalized_image_path(source_path, resolution, save)
+    if os.path.exists(cached_path) and os.path.getsize(cached_path) > 0:
+        return cached_path
+
+    os.makedirs(IMAGE_CACHE_FOLDER, exist_ok=True)
+    partial_path = get_partial_path(cached_path)
+    with Image.open(source_path) as image:
+        # Same result as FFmpeg's scale=force_original_aspect_ratio=decrease + centered pad
+        fitted = ImageOps.contain(image.convert('RGB'), resolution, Image.LANCZOS)
+        canvas = Image.new('RGB', resolution, (0, 0, 0))
+        canvas.paste(fitted, ((resolution[0] - fitted.width) // 2, (resolution[1] - fitted.height) // 2))
+        canvas.save(partial_path, 'JPEG', quality=NORMALIZED_IMAGE_QUALITY)
+    os.replace(partial_path, cached_path)
+    return cached_path
+
+def normalize_images(source_paths, resolution, max_workers=None):
+    """Makes sure every image has a letterboxed cache entry, building missing ones in parallel.
+
+    Returns a dict mapping each source path to its cached path. Raises the first
+    failure so callers can fall back to scaling in FFmpeg.
+    """
+    cached = {}
+    unique_paths = list(dict.fromkeys(source_paths))
+    if unique_paths:
+        with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+            futures = {
+                executor.submit(normalize_image, source_path, resolution, False): source_path
+                for source_path in unique_paths
+            }
+            for future in as_completed(futures):
+                cached[futures[future]] = future.result()
+        content_hash_cache.save()
+    return cached
+
+def prune_cache_folder(folder, keep, grace_seconds=CACHE_PRUNE_GRACE_SECONDS):
+    """Removes the files of a cache folder whose names are not in keep and returns how many.
+
+    Files still being written (.partial) and entries younger than grace_seconds
+    are left alone, so a render that is filling the cache right now keeps them.
+    """
+    if not os.path.exists(folder):
+        return 0
+    removed = 0
+    now = time.time()
+    for file_name in os.listdir(folder):
+        if file_name in keep or '.partial' in file_name:
+            continue
+        cached_path = os.path.join(folder, file_name)
+        try:
+            if now - os.path.getmtime(cached_path) < grace_seconds:
+                continue
+            os.remove(cached_path)
+            removed += 1
+        except FileNotFoundError:
+            continue
+    return removed
+
+def prune_image_cache(source_paths, resolution, grace_seconds=CACHE_PRUNE_GRACE_SECONDS):
+    """Removes cached images that no longer belong to any current source image.
+
+    source_paths must cover every library that renders use.
+    """
+    if not os.path.exists(IMAGE_CACHE_FOLDER):
+        return 0
+    keep = set()
+    for source_path in source_paths:
+        try:
+            keep.add(os.path.basename(get_normalized_image_path(source_path, resolution, False)))
+        except OSError:
+            continue
+    content_hash_cache.save()
+    return prune_cache_folder(IMAGE_CACHE_FOLDER, keep, grace_seconds)
+
+def prune_audio_cache(source_paths, bitrate, sample_rate, grace_seconds=CACHE_PRUNE_GRACE_SECONDS):
+    """Removes normalized tracks whose source is gone, was edited or was cached in another format.
+
+    source_paths must cover every library that renders use.
+    """
+    if not os.path.exists(AUDIO_CACHE_FOLDER):
+        return 0
+    keep = set()
+    for source_path in source_paths:
+        try:
+            keep.add(os.path.basename(get_normalized_audio_path(source_path, bitrate, sample_rate)))
+        except OSError:
+            continue
+    return prune_cache_folder(AUDIO_CACHE_FOLDER, keep, grace_seconds)
+
+def get_image_segment_path(normalized_image_path, duration, encoder_args):
+    """Returns the cache path of a still-image video segment.
+
+    Normalized images are already content-addressed, so the key only needs to add
+    the segment duration and every encoder setting that ends up in the bitstream.
+    """
+    key = json.dumps([os.path.basename(normalized_image_path), duration, encoder_args], sort_keys=True)
+    digest = hashlib.sha1(key.encode('utf8')).hexdigest()
+    return os.path.join(SEGMENT_CACHE_FOLDER, f"{digest}.mp4")
+
+def encode_image_segment(normalized_image_path, duration, encoder_args, session=None):
+    """Encodes one letterboxed image into a closed-GOP H.264 segment and caches it.
+
+    With a render session the encode is cancellable and reports its progress
+    and resources as the 'segments' stage.
+    """
+    # Imported here because mixCreate imports this module
+    from functions.mixCreate import run_ffmpeg
+
+    cached_path = get_image_segment_path(normalized_image_path, duration, encoder_args)
+    if os.path.exists(cached_path) and os.path.getsize(cached_path) > 0:
+        return cached_path
+
+    os.makedirs(SEGMENT_CACHE_FOLDER, exist_ok=True)
+    partial_path = get_partial_path(cached_path)
+    fps = encoder_args['r']
+    # A single closed GOP per segment: every segment starts on an IDR frame so
+    # segments can be joined with stream copy in any order
+    segment_args = dict(encoder_args)
+    segment_args.setdefault('g', int(duration * fps))
+    segment_args.setdefault('keyint_min', int(duration * fps))
+    segment_args.setdefault('sc_threshold', 0)
+    try:
+        run_ffmpeg(
+            ffmpeg
+            .input(normalized_image_path, loop=1, framerate=fps)
+            .output(partial_path, t=duration, an=None, flags='+cgop', **segment_args)
+            .overwrite_output(),
+            session, 'segments', duration
+        )
+        os.replace(partial_path, cached_path)
+    except Exception:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    return cached_path
+
+def encode_image_segments(normalized_image_paths, duration, encoder_args, max_workers=None, session=None):
+    """Makes sure every image has a cached segment, encoding missing ones in parallel.
+
+    Returns a dict mapping each normalized image path to its segment path.
+    """
+    cached = {}
+    missing = []
+    for image_path in dict.fromkeys(normalized_image_paths):
+        segment_path = get_image_segment_path(image_path, duration, encoder_args)
+        if os.path.exists(segment_path) and os.path.getsize(segment_path) > 0:
+            cached[image_path] = segment_path
+        else:
+            missing.append(image_path)
+
+    if missing:
+        print(f"🎞️  Encoding {len(missing)} image segments into the cache...")
+        with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+            futures = {
+                executor.submit(encode_image_segment, image_path, duration, encoder_args, session): image_path
+                for image_path in missing
+            }
+            for future in as_completed(futures):
+                cached[futures[future]] = future.result()
+
+    return cached
+
+def prune_segment_cache(source_paths, resolution, duration, encoder_args, grace_seconds=CACHE_PRUNE_GRACE_SECONDS):
+    """Removes cached segments of vanished images and of encoder settings no longer in use.
+
+    source_paths are the original images of every library that renders use;
+    only segments for the current duration and encoder_args are kept.
+    """
+    if not os.path.exists(SEGMENT_CACHE_FOLDER):
+        return 0
+    keep = set()
+    for source_path in source_paths:
+        try:
+            normalized_image_path = get_normalized_image_path(source_path, resolution, False)
+        except OSError:
+            continue
+        keep.add(os.path.basename(get_image_segment_path(normalized_image_path, duration, encoder_args)))
+    content_hash_cache.save()
+    return prune_cache_folder(SEGMENT_CACHE_FOLDER, keep, grace_seconds)
@@ -0,0 +1,233 @@
+import os
+import time
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from PIL import Image
+from functions import mediaCache
+
+# The index lives next to the other caches, relative to the project root
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MEDIA_INDEX_FILE = os.path.join(BASE_DIR, "cache", "media_index.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS assets (
+    path TEXT PRIMARY KEY,
+    folder TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    content_hash TEXT,
+    duration REAL,
+    codec TEXT,
+    width INTEGER,
+    height INTEGER,
+    sample_rate INTEGER,
+    channels INTEGER,
+    indexed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_assets_folder_kind ON assets (folder, kind);
+CREATE TABLE IF NOT EXISTS scans (
+    folder TEXT PRIMARY KEY,
+    scanned_at REAL NOT NULL
+);
+"""
+ASSET_COLUMNS = ('path', 'folder', 'kind', 'size', 'mtime_ns', 'content_hash', 'duration', 'codec',
+                 'width', 'height', 'sample_rate', 'channels', 'indexed_at')
+
+# Durations seen by this process, so track selection never has to hit the database per pick
+_durations = {}
+_durations_lock = threading.Lock()
+_schema_ready = False
+
+def get_connection():
+    """Opens a connection to the media index, creating the schema on first use"""
+    global _schema_ready
+    os.makedirs(os.path.dirname(MEDIA_INDEX_FILE), exist_ok=True)
+    connection = sqlite3.connect(MEDIA_INDEX_FILE, timeout=30)
+    connection.row_factory = sqlite3.Row
+    # WAL lets renders read while uploads and scans write
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    if not _schema_ready:
+        connection.executescript(SCHEMA)
+        _schema_ready = True
+    return connection
+
+def reset_state():
+    """Forgets the schema check and cached durations, e.g. after MEDIA_INDEX_FILE changed or was deleted"""
+    global _schema_ready
+    with _durations_lock:
+        _schema_ready = False
+        _durations.clear()
+
+def describe_file(file_path, kind):
+    """Collects the index row for one file: size, mtime, content hash and media details"""
+    stat = os.stat(file_path)
+    row = {
+        'path': os.path.abspath(file_path),
+        'folder': os.path.dirname(os.path.abspath(file_path)),
+        'kind': kind,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'content_hash': mediaCache.get_content_hash(file_path, save=False),
+        'duration': None, 'codec': None, 'width': None, 'height': None, 'sample_rate': None, 'channels': None,
+        'indexed_at': time.time(),
+    }
+    if kind == 'audio':
+        info = mediaCache.probe_media(file_path, save=False)
+        row.update({key: info.get(key) for key in ('duration', 'codec', 'sample_rate', 'channels')})
+    else:
+        # Pillow only parses the header here, no full decode
+        with Image.open(file_path) as image:
+            row.update({'width': image.width, 'height': image.height, 'codec': (image.format or '').lower() or None})
+    return row
+
+def _upsert_rows(connection, rows):
+    placeholders = ", ".join("?" for _ in ASSET_COLUMNS)
+    connection.executemany(
+        f"INSERT OR REPLACE INTO assets ({', '.join(ASSET_COLUMNS)}) VALUES ({placeholders})",
+        [tuple(row[column] for column in ASSET_COLUMNS) for row in rows],
+    )
+    with _durations_lock:
+        for row in rows:
+            if row['duration'] is not None:
+                _durations[row['path']] = row['duration']
+
+def scan_folder(folder_path, kind, extensions, max_workers=None):
+    """Incrementally brings the index for one folder up to date.
+
+    Only files whose size or mtime differ from the index are hashed and probed
+    (in parallel); files that disappeared are dropped. Returns a dict with the
+    number of updated, removed and total entries.
+    """
+    folder_path = os.path.abspath(folder_path)
+    connection = get_connection()
+    try:
+        indexed = {
+            row['path']: (row['size'], row['mtime_ns'])
+            for row in connection.execute(
+                "SELECT path, size, mtime_ns FROM assets WHERE folder = ? AND kind = ?", (folder_path, kind))
+        }
+
+        seen = set()
+        changed = []
+        if os.path.exists(folder_path):
+            with os.scandir(folder_path) as entries:
+                for entry in entries:
+                    if not entry.is_file() or not entry.name.lower().endswith(extensions):
+                        continue
+                    seen.add(entry.path)
+                    stat = entry.stat()
+                    if indexed.get(entry.path) != (stat.st_size, stat.st_mtime_ns):
+                        changed.append(entry.path)
+
+        rows = []
+        if changed:
+            print(f"📇 Indexing {len(changed)} new or changed {kind} files in {folder_path}...")
+            with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+                futures = {executor.submit(describe_file, file_path, kind): file_path for file_path in changed}
+                for future in as_completed(futures):
+                    try:
+                        rows.append(future.result())
+                    except Exception as e:
+                        print(f"Warning: Could not index {futures[future]}: {e}")
+            mediaCache.probe_cache.save()
+            mediaCache.content_hash_cache.save()
+
+        removed = [path for path in indexed if path not in seen]
+        with connection:
+            _upsert_rows(connection, rows)
+            connection.executemany("DELETE FROM assets WHERE path = ?", [(path,) for path in removed])
+            connection.execute("INSERT OR REPLACE INTO scans (folder, scanned_at) VALUES (?, ?)", (folder_path, time.time()))
+        return {'updated': len(rows), 'removed': len(removed), 'total': len(seen)}
+    finally:
+        connection.close()
+
+def get_last_scan_time(folder_path):
+    """Returns when a folder was last scanned, or None if it never was"""
+    connection = get_connection()
+    try:
+        row = connection.execute("SELECT scanned_at FROM scans WHERE folder = ?", (os.path.abspath(folder_path),)).fetchone()
+        return row['scanned_at'] if row else None
+    finally:
+        connection.close()
+
+def get_folder_mtime(folder_path):
+    """Returns when files were last added to or removed from a folder, or 0 if it does not exist"""
+    try:
+        return os.stat(folder_path).st_mtime
+    except FileNotFoundError:
+        return 0
+
+def ensure_folder_indexed(folder_path, kind, extensions, max_age):
+    """Rescans a folder if it was never scanned, the last scan is older than max_age seconds
+    or files were added or removed since (the folder's own mtime is newer than the scan)"""
+    scanned_at = get_last_scan_time(folder_path)
+    if scanned_at is None or time.time() - scanned_at > max_age or get_folder_mtime(folder_path) > scanned_at:
+        return scan_folder(folder_path, kind, extensions)
+    return None
+
+def get_indexed_assets(folder_path, kind):
+    """Returns the index rows of a folder as dicts, ordered by path"""
+    connection = get_connection()
+    try:
+        rows = [dict(row) for row in connection.execute(
+            "SELECT * FROM assets WHERE folder = ? AND kind = ? ORDER BY path", (os.path.abspath(folder_path), kind))]
+    finally:
+        connection.close()
+    with _durations_lock:
+        for row in rows:
+            if row['duration'] is not None:
+                _durations[row['path']] = row['duration']
+    return rows
+
+def get_indexed_duration(file_path):
+    """Returns a duration already loaded from the index by this process, or None"""
+    with _durations_lock:
+        return _durations.get(os.path.abspath(file_path))
+
+def index_media_files(file_paths, kind):
+    """Adds or refreshes specific files in the index, e.g. right after they were uploaded"""
+    rows = []
+    for file_path in file_paths:
+        try:
+            rows.append(describe_file(file_path, kind))
+        except Exception as e:
+            print(f"Warning: Could not index {file_path}: {e}")
+    mediaCache.probe_cache.save()
+    mediaCache.content_hash_cache.save()
+
+    connection = get_connection()
+    try:
+        with connection:
+            _upsert_rows(connection, rows)
+    finally:
+        connection.close()
+    return len(rows)
+
+def remove_files_from_index(file_paths):
+    """Drops the index entries of specific files, e.g. ones deleted outside the GUI"""
+    paths = [os.path.abspath(file_path) for file_path in file_paths]
+    connection = get_connection()
+    try:
+        with connection:
+            connection.executemany("DELETE FROM assets WHERE path = ?", [(path,) for path in paths])
+    finally:
+        connection.close()
+    with _durations_lock:
+        for path in paths:
+            _durations.pop(path, None)
+
+def remove_folder_from_index(folder_path):
+    """Drops every index entry of a folder, e.g. after its contents were deleted"""
+    folder_path = os.path.abspath(folder_path)
+    connection = get_connection()
+    try:
+        with connection:
+            connection.execute("DELETE FROM assets WHERE folder = ?", (folder_path,))
+    finally:
+        connection.close()
+    with _durations_lock:
+        for path in [path for path in _durations if os.path.dirname(path) == folder_path]:
+            del _durations[path]
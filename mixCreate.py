@@ -1,10 +1,21 @@
 import os
+import math
 import random
+import argparse
+import json
 import datetime
 import time
 import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_EXCEPTION
 import ffmpeg
+import psutil
+from functions.mediaCache import (
+    normalize_audio_tracks, get_media_duration, warm_probe_cache, normalize_images, prune_image_cache,
+    encode_image_segments, prune_audio_cache, prune_segment_cache,
+)
+from functions.mediaIndex import (
+    ensure_folder_indexed, get_indexed_assets, get_indexed_duration, scan_folder, remove_files_from_index,
+)
 
 # Define supported file extensions
 AUDIO_EXTENSIONS = ('.mp3', '.wav', '.m4a', '.aac', '.flac', '.ogg')
@@ -17,6 +28,8 @@ IMAGES_FOLDER = os.path.join(BASE_DIR, "images")
 FINAL_VIDEOS_FOLDER = os.path.join(BASE_DIR, "finalvideos")
 TEMP_FILES_FOLDER = os.path.join(BASE_DIR, "tempFiles")
 OVERLAY_VIDEO_PATH = os.path.join(BASE_DIR, "myAssets", "subscribe.mp4")
+SLIDESHOW_HISTORY_FILE = os.path.join(BASE_DIR, "cache", "slideshow_history.json")
+CONFIG_FILE = os.path.join(BASE_DIR, "automation_config.json")
 
 # Optimized settings for speed and quality
 AUDIO_CHUNK_DURATION = 60  # in seconds
@@ -24,26 +37,334 @@ IMAGE_DURATION = 10  # in seconds
 OUTPUT_RESOLUTION = (1280, 720)  # Output resolution optimized for speed
 VIDEO_FPS = 24  # Lower FPS for faster processing
 AUDIO_BITRATE = '256k'
+AUDIO_SAMPLE_RATE = 44100
 VIDEO_PRESET = 'ultrafast'
 
+# Selectable x264 encoding profiles
+ENCODING_PROFILES = {
+    # Generic settings: constant VIDEO_FPS with the fastest preset
+    'default': {'preset': VIDEO_PRESET, 'fps': VIDEO_FPS},
+    # Still-image slideshows: stillimage tuning, a low constant frame rate during holds and
+    # one closed GOP per image, with keyframes forced exactly on image changes
+    'static': {'preset': 'veryfast', 'tune': 'stillimage', 'crf': 23, 'fps': 5, 'keyframe_per_image': True},
+}
+ENCODING_PROFILE = 'default'
+
+# Encoder auto-tuning grid and the sample rendered for every grid point
+TUNING_PRESETS = ('ultrafast', 'superfast', 'veryfast', 'faster', 'fast', 'medium')
+TUNING_CRFS = (20, 23, 26, 29)
+TUNING_SAMPLE_DURATION = 60  # in seconds
+TUNING_TARGET_DURATION = 3600  # in seconds, video length the estimate is made for
+
 # Performance optimization flags
 CLEANUP_TEMP_FILES = True
+# Render audio mix, slideshow and merge in one FFmpeg process (falls back to the three-step path on failure)
+SINGLE_PASS_RENDER = True
+# Transcode each track once into a canonical AAC cache and stream-copy it on every render
+USE_AUDIO_CACHE = True
+# Crossfade between consecutive tracks in seconds (0 disables it and keeps audio assembly stream-copy only)
+AUDIO_CROSSFADE = 0
+# Feed images pre-letterboxed to OUTPUT_RESOLUTION by Pillow so FFmpeg skips scale/pad
+USE_IMAGE_CACHE = True
+# Encode every image once into a cached H.264 segment and assemble slideshows by stream copy
+USE_SEGMENT_CACHE = True
+# Read the media library from the SQLite index instead of scanning folders on every render
+USE_MEDIA_INDEX = True
+MEDIA_INDEX_MAX_AGE = 3600  # in seconds, older folder scans are refreshed incrementally before a render
+# Parallel chunked slideshow encoding when the segment cache is not used
+SLIDESHOW_WORKERS = max(1, (os.cpu_count() or 1) // 4)
+SLIDESHOW_MIN_CHUNK_DURATION = 60  # in seconds, shorter videos are encoded in one process
+# Recently shown images remembered per channel so consecutive videos avoid repeating them
+SLIDESHOW_HISTORY_LIMIT = 20000
+# Long-form mode: videos of at least LONG_FORM_THRESHOLD seconds render one loop segment and repeat
+# it by stream copy, so render time stays roughly constant (None disables it)
+LONG_FORM_THRESHOLD = 7200  # in seconds
+LOOP_SEGMENT_DURATION = 900  # in seconds, rounded down to whole images
+LOOP_AUDIO_CROSSFADE = 4  # in seconds, the segment's audio tail is blended into its head at the loop seam
+
+# Batch rendering: budget per concurrent render used to size the worker pool
+BATCH_CORES_PER_RENDER = 4
+BATCH_MEMORY_PER_RENDER_MB = 1536
+
+# Interval at which FFmpeg child processes are sampled for CPU, memory and I/O
+RESOURCE_SAMPLE_INTERVAL = 0.25  # in seconds
+
+# Serializes read-modify-write of the slideshow history between concurrent renders
+slideshow_history_lock = threading.Lock()
+
+# Stage labels shown in progress messages
+STAGE_LABELS = {
+    'single_pass': "Rendering video",
+    'audio_mix': "Mixing audio",
+    'slideshow': "Encoding slideshow",
+    'merge': "Merging audio and video",
+    'loop': "Repeating loop segment",
+    'audio_cache': "Normalizing audio",
+    'segments': "Encoding image segments",
+}
 
 class VideoProgressTracker:
     """Thread-safe progress tracker for video processing"""
     def __init__(self):
         self.progress = 0
         self.status = "Initializing..."
+        self.metrics = None
         self.lock = threading.Lock()
     
-    def update(self, progress, status):
+    def update(self, progress, status, metrics=None):
         with self.lock:
             self.progress = progress
             self.status = status
+            self.metrics = metrics
     
     def get_status(self):
         with self.lock:
             return self.progress, self.status
+    
+    def get_metrics(self):
+        with self.lock:
+            return self.metrics
+
+def format_eta(seconds):
+    """Formats an ETA in seconds as H:MM:SS"""
+    if seconds is None:
+        return "--:--:--"
+    return str(datetime.timedelta(seconds=int(seconds)))
+
+class FFmpegProcessMonitor:
+    """Samples wall time, CPU time, peak RSS and I/O bytes of one FFmpeg child process"""
+    def __init__(self, pid, interval=RESOURCE_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.start_time = time.time()
+        self.end_time = None
+        self.cpu_seconds = 0
+        self.peak_rss = 0
+        self.read_bytes = 0
+        self.write_bytes = 0
+        try:
+            self.process = psutil.Process(pid)
+        except psutil.Error:
+            self.process = None
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+    
+    def sample(self):
+        if not self.process:
+            return
+        try:
+            with self.process.oneshot():
+                cpu_times = self.process.cpu_times()
+                self.cpu_seconds = cpu_times.user + cpu_times.system
+                self.peak_rss = max(self.peak_rss, self.process.memory_info().rss)
+                # io_counters is not available on every platform (e.g. macOS)
+                if hasattr(self.process, 'io_counters'):
+                    io_counters = self.process.io_counters()
+                    self.read_bytes = io_counters.read_bytes
+                    self.write_bytes = io_counters.write_bytes
+        except psutil.Error:
+            pass
+    
+    def _run(self):
+        while not self.stop_event.is_set():
+            self.sample()
+            self.stop_event.wait(self.interval)
+    
+    def start(self):
+        self.thread.start()
+    
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+        self.end_time = time.time()
+    
+    def as_record(self, stage):
+        return {
+            'stage': stage,
+            'start_time': self.start_time,
+            'wall_seconds': (self.end_time or time.time()) - self.start_time,
+            'cpu_seconds': self.cpu_seconds,
+            'peak_rss_bytes': self.peak_rss,
+            'read_bytes': self.read_bytes,
+            'write_bytes': self.write_bytes,
+        }
+
+def summarize_stage_metrics(process_records):
+    """Aggregates per-process resource records into one record per stage (wall time spans all processes)"""
+    stages = {}
+    for record in process_records:
+        stage = stages.setdefault(record['stage'], {
+            'stage': record['stage'], 'processes': 0, 'start_time': record['start_time'], 'end_time': 0,
+            'cpu_seconds': 0, 'peak_rss_bytes': 0, 'read_bytes': 0, 'write_bytes': 0,
+        })
+        stage['processes'] += 1
+        stage['start_time'] = min(stage['start_time'], record['start_time'])
+        stage['end_time'] = max(stage['end_time'], record['start_time'] + record['wall_seconds'])
+        for key in ('cpu_seconds', 'peak_rss_bytes', 'read_bytes', 'write_bytes'):
+            stage[key] += record[key]
+    
+    summary = []
+    for stage in stages.values():
+        stage['wall_seconds'] = stage.pop('end_time') - stage.pop('start_time')
+        summary.append(stage)
+    return summary
+
+class RenderCancelledError(Exception):
+    """Raised by an FFmpeg stage whose render was cancelled by a failing sibling stage"""
+
+class RenderSession:
+    """Tracks the FFmpeg processes of one render for cancellation, progress and resource metrics"""
+    def __init__(self, progress_tracker=None, progress_range=(10, 100)):
+        self.processes = set()
+        self.cancelled = False
+        self.progress_tracker = progress_tracker
+        self.progress_range = progress_range
+        self.stage_weights = {}
+        self.stage_progress = {}
+        self.percent = progress_range[0]
+        self.process_records = []
+        self.lock = threading.Lock()
+    
+    def set_stages(self, stage_weights):
+        """Declares the stages of the render path being run and their share of the total work"""
+        with self.lock:
+            self.stage_weights = dict(stage_weights)
+            self.stage_progress = {}
+    
+    def report_progress(self, stage, process_key, out_time, duration, fps=None, speed=None):
+        """Records one FFmpeg progress update and forwards the overall state to the tracker"""
+        with self.lock:
+            processes = self.stage_progress.setdefault(stage, {})
+            processes[process_key] = {
+                'out_time': min(max(out_time, 0), duration),
+                'duration': duration,
+                'fps': fps,
+                'speed': speed,
+            }
+            
+            # Concurrent processes of one stage (e.g. chunks) add up their media time and rates
+            stage_done = sum(entry['out_time'] for entry in processes.values())
+            stage_total = sum(entry['duration'] for entry in processes.values())
+            stage_fps = sum(entry['fps'] or 0 for entry in processes.values())
+            stage_speed = sum(entry['speed'] or 0 for entry in processes.values())
+            
+            # Unweighted stages (cache fills before the main encode) update the status but not the percent
+            total_weight = sum(self.stage_weights.values())
+            if total_weight and stage in self.stage_weights:
+                completed = 0
+                for name, weight in self.stage_weights.items():
+                    entries = self.stage_progress.get(name, {}).values()
+                    done = sum(entry['out_time'] for entry in entries)
+                    total = sum(entry['duration'] for entry in entries)
+                    if total:
+                        completed += weight * done / total
+                start, end = self.progress_range
+                self.percent = start + (end - start) * completed / total_weight
+            percent = self.percent
+        
+        eta = (stage_total - stage_done) / stage_speed if stage_speed else None
+        metrics = {
+            'stage': stage,
+            'stage_percent': 100 * stage_done / stage_total if stage_total else 0,
+            'fps': stage_fps,
+            'speed': stage_speed,
+            'eta': eta,
+            'updated_at': time.time(),
+        }
+        if self.progress_tracker:
+            status = (f"{STAGE_LABELS.get(stage, stage)}: {metrics['stage_percent']:.0f}% | "
+                      f"{stage_fps:.0f} fps | {stage_speed:.1f}x | ETA {format_eta(eta)}")
+            self.progress_tracker.update(int(percent), status, metrics)
+    
+    def register(self, process):
+        with self.lock:
+            self.processes.add(process)
+            if self.cancelled:
+                process.kill()
+    
+    def unregister(self, process):
+        with self.lock:
+            self.processes.discard(process)
+    
+    def record_process(self, record):
+        with self.lock:
+            self.process_records.append(record)
+    
+    def get_stage_metrics(self):
+        """Returns one resource record per FFmpeg stage run so far"""
+        with self.lock:
+            return summarize_stage_metrics(self.process_records)
+    
+    def cancel(self):
+        """Kills every FFmpeg process of this render that is still running"""
+        with self.lock:
+            self.cancelled = True
+            for process in self.processes:
+                if process.poll() is None:
+                    process.kill()
+
+def parse_ffmpeg_progress(lines):
+    """Yields one dict per block of FFmpeg '-progress' key=value output"""
+    values = {}
+    for raw_line in lines:
+        key, _, value = raw_line.decode('utf8', 'replace').strip().partition('=')
+        values[key] = value
+        if key == 'progress':
+            yield values
+            values = {}
+
+def parse_progress_number(value, suffix=''):
+    """Converts an FFmpeg progress value such as '212.5' or '8.7x' to float, None for N/A"""
+    try:
+        return float(value[:-len(suffix)] if suffix and value.endswith(suffix) else value)
+    except (TypeError, ValueError):
+        return None
+
+def run_ffmpeg(stream_spec, session=None, stage=None, duration=None):
+    """Runs an FFmpeg command like ffmpeg-python's run(), but cancellable and with progress through the session"""
+    if session and session.cancelled:
+        raise RenderCancelledError("Render was cancelled")
+    
+    report_progress = bool(session and session.progress_tracker and stage and duration)
+    if report_progress:
+        stream_spec = stream_spec.global_args('-progress', 'pipe:1', '-nostats')
+    
+    process = stream_spec.run_async(cmd=['ffmpeg', '-y'], pipe_stdout=True, pipe_stderr=True)
+    monitor = None
+    if session:
+        session.register(process)
+        monitor = FFmpegProcessMonitor(process.pid)
+        monitor.start()
+    try:
+        if report_progress:
+            # Drain stderr on the side so FFmpeg never blocks on a full pipe
+            stderr_chunks = []
+            stderr_thread = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+            stderr_thread.start()
+            for values in parse_ffmpeg_progress(iter(process.stdout.readline, b'')):
+                out_time_us = parse_progress_number(values.get('out_time_us'))
+                if out_time_us is None:
+                    continue
+                session.report_progress(
+                    stage, process.pid, out_time_us / 1000000, duration,
+                    fps=parse_progress_number(values.get('fps')),
+                    speed=parse_progress_number(values.get('speed'), 'x'),
+                )
+            process.wait()
+            stderr_thread.join()
+            out, err = b'', b''.join(stderr_chunks)
+        else:
+            out, err = process.communicate()
+    finally:
+        if session:
+            session.unregister(process)
+            monitor.stop()
+            session.record_process(monitor.as_record(stage or 'ffmpeg'))
+    
+    if session and session.cancelled:
+        raise RenderCancelledError("Render was cancelled")
+    if process.returncode:
+        raise ffmpeg.Error('ffmpeg', out, err)
+    return out, err
 
 def ensure_directory_exists(directory_path):
     """Ensure directory exists, create if it doesn't"""
@@ -69,6 +390,41 @@ def get_supported_files(folder_path, extensions):
         print(f"Error scanning directory {folder_path}: {e}")
         return []
 
+def get_media_files(folder_path, extensions, kind):
+    """Lists the media files of a folder from the media index, falling back to a directory scan"""
+    if USE_MEDIA_INDEX:
+        try:
+            ensure_folder_indexed(folder_path, kind, extensions, MEDIA_INDEX_MAX_AGE)
+            files = [asset['path'] for asset in get_indexed_assets(folder_path, kind)]
+            if not files:
+                print(f"Warning: No supported files indexed in {folder_path}")
+            return files
+        except Exception as e:
+            print(f"⚠️  Media index unavailable ({e}), scanning {folder_path} instead")
+    return get_supported_files(folder_path, extensions)
+
+def drop_missing_media(file_paths, kind):
+    """Returns the planned files that no longer exist and drops them from the media index"""
+    missing = [file_path for file_path in dict.fromkeys(file_paths) if not os.path.exists(file_path)]
+    if missing:
+        print(f"⚠️  {len(missing)} planned {kind} file(s) no longer exist, planning without them")
+        if USE_MEDIA_INDEX:
+            try:
+                remove_files_from_index(missing)
+            except Exception as e:
+                print(f"Warning: Could not drop missing files from the media index: {e}")
+    return missing
+
+def rescan_media_folders(*folders):
+    """Brings the index of each (folder_path, extensions, kind) up to date right away"""
+    if not USE_MEDIA_INDEX:
+        return
+    for folder_path, extensions, kind in folders:
+        try:
+            scan_folder(folder_path, kind, extensions)
+        except Exception as e:
+            print(f"Warning: Could not rescan {folder_path}: {e}")
+
 def cleanup_temp_files(file_paths):
     """Clean up temporary files with proper error handling"""
     for file_path in file_paths:
@@ -81,39 +437,355 @@ def cleanup_temp_files(file_paths):
             except Exception as e:
                 print(f"Warning: Error cleaning up {file_path}: {e}")
 
-def create_audio_mix_ffmpeg(audio_files, total_video_duration, temp_file_path):
-    """Generates an optimized audio mix using FFmpeg's concat protocol."""
+def load_tuned_profile():
+    """Registers the 'tuned' encoding profile persisted by the auto-tuner, if any"""
+    try:
+        if not os.path.exists(CONFIG_FILE):
+            return
+        with open(CONFIG_FILE, 'r') as f:
+            tuned = json.load(f).get('tuned_encoder')
+    except Exception as e:
+        print(f"Warning: Could not read tuned encoder settings: {e}")
+        return
+    if tuned and tuned.get('base_profile') in ENCODING_PROFILES:
+        ENCODING_PROFILES['tuned'] = dict(ENCODING_PROFILES[tuned['base_profile']], preset=tuned['preset'], crf=tuned['crf'])
+
+def save_tuned_profile(tuned):
+    """Persists auto-tuned encoder settings in the config and makes them the active profile"""
+    config = {}
+    if os.path.exists(CONFIG_FILE):
+        with open(CONFIG_FILE, 'r') as f:
+            config = json.load(f)
+    config['tuned_encoder'] = tuned
+    config['encoding_profile'] = 'tuned'
+    with open(CONFIG_FILE, 'w') as f:
+        json.dump(config, f, indent=2)
+    load_tuned_profile()
+    print(f"💾 Tuned encoder settings saved to: {CONFIG_FILE}")
+
+# Make a previously tuned profile selectable as soon as the module is imported
+load_tuned_profile()
+
+def set_encoding_profile(profile_name):
+    """Selects the encoding profile used by every following render"""
+    global ENCODING_PROFILE
+    if profile_name not in ENCODING_PROFILES:
+        raise ValueError(f"Unknown encoding profile '{profile_name}', choose from: {', '.join(ENCODING_PROFILES)}")
+    ENCODING_PROFILE = profile_name
+    print(f"🎛️  Encoding profile: {profile_name}")
+
+def get_video_encoder_args(profile_name=None):
+    """Output arguments shared by every H.264 encode of the slideshow (YouTube-compatible yuv420p, constant fps)"""
+    profile = ENCODING_PROFILES[profile_name or ENCODING_PROFILE]
+    fps = profile.get('fps', VIDEO_FPS)
+    args = {
+        'vcodec': 'libx264',
+        'pix_fmt': 'yuv420p',
+        'preset': profile.get('preset', VIDEO_PRESET),
+        'r': fps,
+    }
+    if 'tune' in profile:
+        args['tune'] = profile['tune']
+    if 'crf' in profile:
+        args['crf'] = profile['crf']
+    if profile.get('keyframe_per_image'):
+        gop_size = int(IMAGE_DURATION * fps)
+        args.update({
+            'g': gop_size,
+            'keyint_min': gop_size,
+            'sc_threshold': 0,
+            'force_key_frames': f"expr:gte(t,n_forced*{IMAGE_DURATION})",
+        })
+    return args
+
+def get_track_durations(audio_files):
+    """Returns {path: duration} for every usable track, from the media index or probe cache"""
+    durations = {}
+    missing = []
+    for audio_file in audio_files:
+        duration = get_indexed_duration(audio_file)
+        if duration:
+            durations[audio_file] = duration
+        else:
+            missing.append(audio_file)
+    
+    if missing:
+        # ffprobe only runs for tracks that are new or changed, in parallel
+        warm_probe_cache(missing)
+        for audio_file in missing:
+            try:
+                durations[audio_file] = get_media_duration(audio_file)
+            except Exception as e:
+                print(f"Warning: Failed to probe duration for {audio_file}. Skipping. Error: {e}")
+    return durations
+
+def plan_audio_playlist(audio_files, total_video_duration, crossfade=None):
+    """Plans a random track sequence filling the duration exactly, as {'path', 'duration', 'outpoint'} dicts"""
     if not audio_files:
         raise ValueError("No audio files provided")
+    crossfade = AUDIO_CROSSFADE if crossfade is None else crossfade
 
-    audio_list = []
-    total_duration = 0
-    available_files = audio_files[:]
+    # Tracks shorter than two crossfades cannot be blended on both ends
+    durations = {path: duration for path, duration in get_track_durations(audio_files).items()
+                 if duration > 2 * crossfade}
+    if not durations:
+        raise ValueError("No valid audio files could be processed for mixing.")
 
-    # Prepare audio list for the desired duration
-    while total_duration < total_video_duration and available_files:
-        audio_file = random.choice(available_files)
-        # We need a robust way to get duration without loading the file fully
-        # A simple ffprobe call is more efficient
-        try:
-            probe = ffmpeg.probe(audio_file)
-            duration = float(probe['format']['duration'])
-        except Exception as e:
-            print(f"Warning: Failed to probe duration for {audio_file}. Skipping. Error: {e}")
-            available_files.remove(audio_file)
-            continue
+    while True:
+        playlist = sample_audio_playlist(durations, total_video_duration, crossfade)
+        missing = drop_missing_media([entry['path'] for entry in playlist], 'audio')
+        if not missing:
+            break
+        for path in missing:
+            del durations[path]
+        if not durations:
+            raise ValueError("No valid audio files could be processed for mixing.")
+
+    planned = sum(entry['outpoint'] or entry['duration'] for entry in playlist) - crossfade * (len(playlist) - 1)
+    print(f"🎵 Planned {len(playlist)} tracks for {planned:.2f}s of audio (target {total_video_duration}s)")
+    return playlist
+
+def sample_audio_playlist(durations, total_video_duration, crossfade):
+    """Draws one random playlist from {path: duration}; see plan_audio_playlist"""
+    playlist = []
+    used = set()
+    remaining = total_video_duration
+    while remaining > 0:
+        previous = playlist[-1]['path'] if playlist else None
+        overlap = crossfade if playlist else 0
+        candidates = [path for path in durations if path != previous] or list(durations)
+        unused = [path for path in candidates if path not in used]
+        
+        fitting = [path for path in (unused or candidates) if durations[path] - overlap >= remaining]
+        if fitting:
+            # Final track: the outpoint trims it to land exactly on the target, so any fitting one works
+            path = random.choice(fitting)
+            playlist.append({'path': path, 'duration': durations[path], 'outpoint': remaining + overlap})
+            break
         
-        audio_list.append(audio_file)
-        total_duration += duration
+        path = random.choice(unused or candidates)
+        playlist.append({'path': path, 'duration': durations[path], 'outpoint': None})
+        used.add(path)
+        remaining -= durations[path] - overlap
+    return playlist
 
-    if not audio_list:
-        raise ValueError("No valid audio files could be processed for mixing.")
+def get_audio_encoder_args():
+    """Output arguments for encoding audio to AAC"""
+    return {'acodec': 'aac', 'ar': AUDIO_SAMPLE_RATE, 'ab': AUDIO_BITRATE}
+
+def prepare_audio_sources(audio_list, session=None):
+    """Maps selected tracks to cached normalized copies and returns them with the audio output arguments"""
+    encode_args = get_audio_encoder_args()
+    if not USE_AUDIO_CACHE:
+        return audio_list, encode_args
+
+    try:
+        cached = normalize_audio_tracks(audio_list, AUDIO_BITRATE, AUDIO_SAMPLE_RATE, session=session)
+    except RenderCancelledError:
+        raise
+    except Exception as e:
+        print(f"⚠️  Audio cache unavailable ({e}), re-encoding selected tracks instead")
+        return audio_list, encode_args
+
+    return [cached[file] for file in audio_list], {'acodec': 'copy'}
+
+def prepare_image_sources(image_files):
+    """Maps images to letterboxed cached copies and returns them with whether FFmpeg still has to scale them"""
+    if not USE_IMAGE_CACHE:
+        return image_files, True
+
+    try:
+        cached = normalize_images(image_files, OUTPUT_RESOLUTION)
+    except Exception as e:
+        print(f"⚠️  Image cache unavailable ({e}), scaling images in FFmpeg instead")
+        return image_files, True
+
+    return [cached[img] for img in image_files], False
+
+def load_slideshow_history():
+    """Reads the per-channel history of recently shown images"""
+    if not os.path.exists(SLIDESHOW_HISTORY_FILE):
+        return {}
+    try:
+        with open(SLIDESHOW_HISTORY_FILE, 'r') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Warning: Could not read slideshow history, starting empty: {e}")
+        return {}
+
+def save_slideshow_history(history):
+    """Writes the slideshow history atomically"""
+    os.makedirs(os.path.dirname(SLIDESHOW_HISTORY_FILE), exist_ok=True)
+    partial_path = f"{SLIDESHOW_HISTORY_FILE}.partial"
+    with open(partial_path, 'w') as f:
+        json.dump(history, f)
+    os.replace(partial_path, SLIDESHOW_HISTORY_FILE)
+
+def plan_slideshow_images(image_files, total_video_duration, channel_name=None, record=True):
+    """Picks the images a slideshow of the given duration shows, avoiding the channel's recent ones"""
+    if not image_files:
+        raise ValueError("No image files provided")
+    needed = max(1, math.ceil(total_video_duration / IMAGE_DURATION))
+    channel_key = channel_name or 'default'
+
+    with slideshow_history_lock:
+        history = load_slideshow_history()
+        recent = history.get(channel_key, [])
+
+        while True:
+            planned = sample_slideshow_images(image_files, needed, recent)
+            missing = set(drop_missing_media(planned, 'image'))
+            if not missing:
+                break
+            image_files = [img for img in image_files if img not in missing]
+            if not image_files:
+                raise ValueError("No image files provided")
+        if len(image_files) * IMAGE_DURATION < total_video_duration:
+            print(f"🔁 Only {len(image_files)} images for {needed} slots, cycling the library")
+
+        if record:
+            shown = set(planned)
+            recent = [img for img in recent if img not in shown] + list(dict.fromkeys(planned))
+            history[channel_key] = recent[-SLIDESHOW_HISTORY_LIMIT:]
+            try:
+                save_slideshow_history(history)
+            except Exception as e:
+                print(f"Warning: Could not save slideshow history: {e}")
+
+    return planned
+
+def sample_slideshow_images(image_files, needed, recent):
+    """Draws needed images, avoiding the recent ones; see plan_slideshow_images"""
+    if len(image_files) > needed:
+        # Exclude as much recent history as still leaves enough fresh images
+        excluded = set(recent[-(len(image_files) - needed):])
+        fresh = [img for img in image_files if img not in excluded]
+        return random.sample(fresh, needed)
+
+    planned = []
+    while len(planned) < needed:
+        cycle = random.sample(image_files, len(image_files))
+        if planned and len(cycle) > 1 and cycle[0] == planned[-1]:
+            cycle[0], cycle[-1] = cycle[-1], cycle[0]
+        planned.extend(cycle)
+    return planned[:needed]
+
+def build_slideshow_stream(image_list_path, total_video_duration, needs_scaling=True):
+    """Builds the FFmpeg video stream for an image concat list at OUTPUT_RESOLUTION"""
+    stream = ffmpeg.input(image_list_path, format='concat', safe=0, t=total_video_duration).video
+    if needs_scaling:
+        stream = (
+            stream
+            .filter('scale', size=f"{OUTPUT_RESOLUTION[0]}x{OUTPUT_RESOLUTION[1]}", force_original_aspect_ratio='decrease')
+            .filter('pad', w=OUTPUT_RESOLUTION[0], h=OUTPUT_RESOLUTION[1], x='(ow-iw)/2', y='(oh-ih)/2')
+        )
+    return stream
+
+def prepare_segment_sources(image_files, total_video_duration, session=None):
+    """Returns cached per-image H.264 segments covering the requested duration"""
+    image_files = image_files[:math.ceil(total_video_duration / IMAGE_DURATION)]
+    image_files, needs_scaling = prepare_image_sources(image_files)
+    if needs_scaling:
+        raise RuntimeError("segment cache needs the normalized image cache")
+
+    segments = encode_image_segments(image_files, IMAGE_DURATION, get_video_encoder_args(), session=session)
+    return [segments[img] for img in image_files]
+
+def prepare_segment_stream(image_files, total_video_duration, list_path, session=None):
+    """Returns a (stream, output args) pair stream-copying cached segments, or None without the segment cache"""
+    if not USE_SEGMENT_CACHE:
+        return None
+
+    try:
+        segment_files = prepare_segment_sources(image_files, total_video_duration, session)
+    except RenderCancelledError:
+        raise
+    except Exception as e:
+        print(f"⚠️  Segment cache unavailable ({e}), encoding the slideshow instead")
+        return None
 
-    # Create a text file with the list of audio files to concatenate
-    concat_list_path = os.path.join(os.path.dirname(temp_file_path), "concat_audio_list.txt")
-    with open(concat_list_path, 'w') as f:
+    with open(list_path, 'w') as f:
+        for segment in segment_files:
+            f.write(f"file '{segment}'\n")
+    stream = ffmpeg.input(list_path, format='concat', safe=0, t=total_video_duration).video
+    return stream, {'vcodec': 'copy'}
+
+def prepare_video_source(image_files, total_video_duration, list_path, session=None):
+    """Builds the slideshow video stream and its output arguments, preferring cached segments"""
+    segment_source = prepare_segment_stream(image_files, total_video_duration, list_path, session)
+    if segment_source:
+        return segment_source
+
+    image_files, needs_scaling = prepare_image_sources(image_files)
+    write_image_concat_list(image_files, list_path)
+    return build_slideshow_stream(list_path, total_video_duration, needs_scaling), get_video_encoder_args()
+
+def write_audio_concat_list(audio_list, list_path, last_outpoint=None):
+    """Writes an FFmpeg concat demuxer list for the selected audio tracks, optionally trimming the last one"""
+    with open(list_path, 'w') as f:
         for file in audio_list:
             f.write(f"file '{file}'\n")
+        if last_outpoint is not None:
+            f.write(f"outpoint {last_outpoint:.6f}\n")
+    return list_path
+
+def build_loop_seam(audio_stream, total_video_duration, loop_crossfade):
+    """Crossfades the last loop_crossfade seconds of a stream into its start so the result loops seamlessly"""
+    split = audio_stream.filter_multi_output('asplit', 3)
+    head, body, tail = split[0], split[1], split[2]
+    head = (head.filter('atrim', end=loop_crossfade).filter('asetpts', 'PTS-STARTPTS')
+            .filter('afade', t='in', d=loop_crossfade, curve='qsin'))
+    tail = (tail.filter('atrim', start=total_video_duration, end=total_video_duration + loop_crossfade)
+            .filter('asetpts', 'PTS-STARTPTS')
+            .filter('afade', t='out', d=loop_crossfade, curve='qsin'))
+    body = body.filter('atrim', start=loop_crossfade, end=total_video_duration).filter('asetpts', 'PTS-STARTPTS')
+    seam = ffmpeg.filter([tail, head], 'amix', inputs=2, duration='longest', normalize=0)
+    return ffmpeg.concat(seam, body, v=0, a=1)
+
+def prepare_audio_stream(audio_files, total_video_duration, list_path, loop_crossfade=0, session=None):
+    """Plans the playlist and builds the audio stream plus its FFmpeg output arguments"""
+    # A loop seam needs loop_crossfade seconds of audio beyond the end to blend into the start
+    loop_crossfade = min(loop_crossfade, total_video_duration / 2)
+    playlist = plan_audio_playlist(audio_files, total_video_duration + loop_crossfade)
+    sources, audio_args = prepare_audio_sources([entry['path'] for entry in playlist], session)
+    
+    if AUDIO_CROSSFADE > 0 and len(playlist) > 1:
+        streams = []
+        for entry, source in zip(playlist, sources):
+            stream = ffmpeg.input(source).audio
+            if entry['outpoint'] is not None:
+                stream = stream.filter('atrim', end=entry['outpoint'])
+            streams.append(stream)
+        audio_stream = streams[0]
+        for stream in streams[1:]:
+            audio_stream = ffmpeg.filter([audio_stream, stream], 'acrossfade', d=AUDIO_CROSSFADE)
+        audio_args = get_audio_encoder_args()
+    else:
+        write_audio_concat_list(sources, list_path, playlist[-1]['outpoint'])
+        audio_stream = ffmpeg.input(list_path, format='concat', safe=0).audio
+    
+    if loop_crossfade > 0:
+        audio_stream = build_loop_seam(audio_stream, total_video_duration, loop_crossfade)
+        audio_args = get_audio_encoder_args()
+    return audio_stream, audio_args
+
+def write_image_concat_list(image_files, list_path):
+    """Writes an FFmpeg concat demuxer list showing each image for IMAGE_DURATION"""
+    with open(list_path, 'w') as f:
+        # Create a list of images with their durations
+        for img in image_files:
+            f.write(f"file '{img}'\n")
+            f.write(f"duration {IMAGE_DURATION}\n")
+        # Ensure the last image duration is explicitly set
+        f.write(f"file '{image_files[-1]}'\n")
+    return list_path
+
+def create_audio_mix_ffmpeg(audio_files, total_video_duration, temp_file_path, session=None, loop_crossfade=0):
+    """Generates an optimized audio mix using FFmpeg's concat protocol."""
+    # Plan exactly the audio the video needs; the concat list is only written without crossfades
+    concat_list_path = f"{temp_file_path}.list.txt"
+    audio_stream, audio_args = prepare_audio_stream(audio_files, total_video_duration, concat_list_path,
+                                                    loop_crossfade, session)
 
     # Use ffmpeg-python to concatenate the audio files
     print("Concatenating audio files with FFmpeg...")
@@ -121,14 +793,13 @@ def create_audio_mix_ffmpeg(audio_files, total_video_duration, temp_file_path):
         print(f"🔧 Audio FFmpeg command details:")
         print(f"   Input list: {concat_list_path}")
         print(f"   Output: {temp_file_path}")
-        print(f"   Bitrate: {AUDIO_BITRATE}")
+        print(f"   Audio: {'stream copy from cache' if audio_args['acodec'] == 'copy' else AUDIO_BITRATE}")
         
-        (
-            ffmpeg
-            .input(concat_list_path, format='concat', safe=0)
-            .output(temp_file_path, acodec='aac', ar=44100, ab=AUDIO_BITRATE)
-            .overwrite_output()
-            .run(cmd=['ffmpeg', '-y'], capture_stderr=True, quiet=True)
+        run_ffmpeg(
+            audio_stream
+            .output(temp_file_path, t=total_video_duration, **audio_args)
+            .overwrite_output(),
+            session, 'audio_mix', total_video_duration
         )
         
         # Verify the output file was created
@@ -152,22 +823,22 @@ def create_audio_mix_ffmpeg(audio_files, total_video_duration, temp_file_path):
         print(f"❌ Unexpected error during audio generation: {e}")
         raise
 
-    os.remove(concat_list_path)
+    cleanup_temp_files([concat_list_path])
     return temp_file_path
 
-def create_image_slideshow_ffmpeg(image_files, total_video_duration, temp_file_path):
+def create_image_slideshow_ffmpeg(image_files, total_video_duration, temp_file_path, session=None):
     """Generates an image slideshow video using FFmpeg from a list of images."""
     if not image_files:
         raise ValueError("No image files provided")
 
-    image_list_path = os.path.join(os.path.dirname(temp_file_path), "image_list.txt")
-    with open(image_list_path, 'w') as f:
-        # Create a list of images with their durations
-        for img in image_files:
-            f.write(f"file '{img}'\n")
-            f.write(f"duration {IMAGE_DURATION}\n")
-        # Ensure the last image duration is explicitly set
-        f.write(f"file '{image_files[-1]}'\n")
+    image_list_path = f"{temp_file_path}.list.txt"
+    segment_source = prepare_segment_stream(image_files, total_video_duration, image_list_path, session)
+    if segment_source:
+        video_stream, video_args = segment_source
+    elif SLIDESHOW_WORKERS > 1 and total_video_duration >= 2 * SLIDESHOW_MIN_CHUNK_DURATION:
+        return create_image_slideshow_chunked_ffmpeg(image_files, total_video_duration, temp_file_path, session=session)
+    else:
+        video_stream, video_args = prepare_video_source(image_files, total_video_duration, image_list_path, session)
 
     print("Creating image slideshow with FFmpeg...")
     try:
@@ -177,14 +848,11 @@ def create_image_slideshow_ffmpeg(image_files, total_video_duration, temp_file_p
         print(f"   Resolution: {OUTPUT_RESOLUTION[0]}x{OUTPUT_RESOLUTION[1]}")
         print(f"   Duration: {total_video_duration}s")
         
-        (
-            ffmpeg
-            .input(image_list_path, format='concat', safe=0, t=total_video_duration)
-            .filter('scale', size=f"{OUTPUT_RESOLUTION[0]}x{OUTPUT_RESOLUTION[1]}", force_original_aspect_ratio='decrease')
-            .filter('pad', w=OUTPUT_RESOLUTION[0], h=OUTPUT_RESOLUTION[1], x='(ow-iw)/2', y='(oh-ih)/2')
-            .output(temp_file_path, vcodec='libx264', pix_fmt='yuv420p', preset=VIDEO_PRESET, r=VIDEO_FPS)
-            .overwrite_output()
-            .run(cmd=['ffmpeg', '-y'], capture_stderr=True, quiet=True)
+        run_ffmpeg(
+            video_stream
+            .output(temp_file_path, **video_args)
+            .overwrite_output(),
+            session, 'slideshow', total_video_duration
         )
         
         # Verify the output file was created
@@ -211,28 +879,196 @@ def create_image_slideshow_ffmpeg(image_files, total_video_duration, temp_file_p
     os.remove(image_list_path)
     return temp_file_path
 
-def generate_video_ffmpeg(audio_files, image_files, final_videos_folder, total_video_duration, progress_tracker=None):
+def encode_slideshow_chunk(chunk_images, chunk_duration, chunk_path, needs_scaling, threads, session=None):
+    """Encodes one chunk of the slideshow and returns its encode time in seconds"""
+    list_path = write_image_concat_list(chunk_images, f"{chunk_path}.list.txt")
+    start_time = time.time()
+    try:
+        run_ffmpeg(
+            build_slideshow_stream(list_path, chunk_duration, needs_scaling)
+            .output(chunk_path, threads=threads, **get_video_encoder_args())
+            .overwrite_output(),
+            session, 'slideshow', chunk_duration
+        )
+    finally:
+        cleanup_temp_files([list_path])
+    return time.time() - start_time
+
+def create_image_slideshow_chunked_ffmpeg(image_files, total_video_duration, temp_file_path, workers=None, session=None):
+    """Encodes the slideshow as parallel GOP-aligned chunks and joins them with stream copy"""
+    if not image_files:
+        raise ValueError("No image files provided")
+
+    workers = workers or SLIDESHOW_WORKERS
+    image_files = image_files[:math.ceil(total_video_duration / IMAGE_DURATION)]
+    image_files, needs_scaling = prepare_image_sources(image_files)
+
+    chunk_count = max(1, min(workers, int(total_video_duration // SLIDESHOW_MIN_CHUNK_DURATION), len(image_files)))
+    images_per_chunk = math.ceil(len(image_files) / chunk_count)
+    threads = max(1, (os.cpu_count() or 1) // chunk_count)
+
+    chunks = []
+    for index, start in enumerate(range(0, len(image_files), images_per_chunk)):
+        chunk_images = image_files[start:start + images_per_chunk]
+        chunk_duration = min(len(chunk_images) * IMAGE_DURATION, total_video_duration - start * IMAGE_DURATION)
+        if chunk_duration > 0:
+            chunks.append((index, chunk_images, chunk_duration, f"{temp_file_path}.chunk{index}.mp4"))
+
+    print(f"Encoding slideshow in {len(chunks)} parallel chunks ({threads} threads each)...")
+    chunk_list_path = f"{temp_file_path}.chunks.txt"
+    chunk_paths = [chunk[3] for chunk in chunks]
+    timings = {}
+    start_time = time.time()
+    try:
+        with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+            futures = {
+                executor.submit(encode_slideshow_chunk, chunk_images, chunk_duration, chunk_path, needs_scaling, threads, session): index
+                for index, chunk_images, chunk_duration, chunk_path in chunks
+            }
+            for future in as_completed(futures):
+                timings[futures[future]] = future.result()
+        encode_time = time.time() - start_time
+
+        with open(chunk_list_path, 'w') as f:
+            for chunk_path in chunk_paths:
+                f.write(f"file '{chunk_path}'\n")
+        run_ffmpeg(
+            ffmpeg
+            .input(chunk_list_path, format='concat', safe=0)
+            .output(temp_file_path, vcodec='copy')
+            .overwrite_output(),
+            session
+        )
+        concat_time = time.time() - start_time - encode_time
+
+        if not os.path.exists(temp_file_path) or os.path.getsize(temp_file_path) == 0:
+            raise FileNotFoundError(f"FFmpeg chunk concatenation produced no output: {temp_file_path}")
+
+    except ffmpeg.Error as e:
+        print(f"❌ FFmpeg chunked video generation failed:")
+        if hasattr(e, 'stderr') and e.stderr:
+            print(f"   Error details: {e.stderr.decode('utf8')}")
+        else:
+            print(f"   Error: {e}")
+        raise
+    finally:
+        cleanup_temp_files(chunk_paths + [chunk_list_path])
+
+    print(f"⏱️  Chunk timing breakdown:")
+    for index, chunk_images, chunk_duration, _ in chunks:
+        print(f"   Chunk {index + 1}/{len(chunks)}: {len(chunk_images)} images, {chunk_duration}s of video "
+              f"in {timings[index]:.2f}s ({chunk_duration / timings[index]:.1f}x realtime)")
+    print(f"   Parallel encode: {encode_time:.2f}s, concat: {concat_time:.2f}s")
+    print(f"✅ Temporary video created successfully: {temp_file_path} ({os.path.getsize(temp_file_path)} bytes)")
+    return temp_file_path
+
+def render_video_single_pass_ffmpeg(audio_files, image_files, final_video_path, total_video_duration, session=None,
+                                    loop_crossfade=0):
+    """Renders the final video in one FFmpeg invocation without intermediate media files"""
+    if not image_files:
+        raise ValueError("No image files provided")
+
+    audio_list_path = f"{final_video_path}.audio.txt"
+    audio_stream, audio_args = prepare_audio_stream(audio_files, total_video_duration, audio_list_path,
+                                                    loop_crossfade, session)
+    image_list_path = f"{final_video_path}.images.txt"
+    video_stream, video_args = prepare_video_source(image_files, total_video_duration, image_list_path, session)
+
+    print("Rendering video in a single FFmpeg pass...")
+    try:
+        print(f"🔧 Single-pass FFmpeg command details:")
+        print(f"   Audio list: {audio_list_path}")
+        print(f"   Image list: {image_list_path}")
+        print(f"   Output: {final_video_path}")
+        print(f"   Resolution: {OUTPUT_RESOLUTION[0]}x{OUTPUT_RESOLUTION[1]}")
+        print(f"   Duration: {total_video_duration}s")
+
+        run_ffmpeg(
+            ffmpeg
+            .output(video_stream, audio_stream, final_video_path, t=total_video_duration,
+                    **audio_args, **video_args)
+            .overwrite_output(),
+            session, 'single_pass', total_video_duration
+        )
+
+        if not os.path.exists(final_video_path):
+            raise FileNotFoundError(f"FFmpeg single-pass render completed but output file not found: {final_video_path}")
+
+        file_size = os.path.getsize(final_video_path)
+        if file_size == 0:
+            raise ValueError(f"FFmpeg single-pass render completed but output file is empty: {final_video_path}")
+
+        print(f"✅ Single-pass render completed: {final_video_path} ({file_size} bytes)")
+
+    except ffmpeg.Error as e:
+        print(f"❌ FFmpeg single-pass render failed:")
+        if hasattr(e, 'stderr') and e.stderr:
+            print(f"   Error details: {e.stderr.decode('utf8')}")
+        else:
+            print(f"   Error: {e}")
+        raise
+    finally:
+        cleanup_temp_files([audio_list_path, image_list_path])
+
+    return final_video_path
+
+def generate_video_ffmpeg(audio_files, image_files, final_videos_folder, total_video_duration, progress_tracker=None,
+                          stage_metrics=None, progress_range=(10, 100), loop_crossfade=0, output_path=None):
     """Main function to generate video using ffmpeg-python for optimized performance."""
     
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    final_video_path = os.path.join(final_videos_folder, f"video_{timestamp}.mp4")
+    # Microseconds keep names unique when several renders start in the same second
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    final_video_path = output_path or os.path.join(final_videos_folder, f"video_{timestamp}.mp4")
+    session = RenderSession(progress_tracker, progress_range)
+    progress_start, progress_end = progress_range
+    
+    if SINGLE_PASS_RENDER:
+        session.set_stages({'single_pass': 1})
+        try:
+            if progress_tracker:
+                progress_tracker.update(progress_start, "Rendering video in a single FFmpeg pass...")
+            render_video_single_pass_ffmpeg(audio_files, image_files, final_video_path, total_video_duration, session,
+                                            loop_crossfade)
+            
+            if progress_tracker:
+                progress_tracker.update(progress_end, "Video creation completed!")
+            
+            print(f"✅ Final video created successfully at: {final_video_path}")
+            print(f"Video file size: {os.path.getsize(final_video_path) / (1024*1024):.2f} MB")
+            if stage_metrics is not None:
+                stage_metrics.extend(session.get_stage_metrics())
+            return final_video_path
+        except Exception as e:
+            print(f"⚠️  Single-pass render failed ({e}), falling back to three-step render...")
+            cleanup_temp_files([final_video_path])
     
     temp_audio_path = os.path.join(TEMP_FILES_FOLDER, f"temp_audio_{timestamp}.aac")
     temp_video_path = os.path.join(TEMP_FILES_FOLDER, f"temp_video_{timestamp}.mp4")
     
     temp_files_to_clean = [temp_audio_path, temp_video_path]
+    session.set_stages({'audio_mix': 1, 'slideshow': 3, 'merge': 1})
     
     try:
         if progress_tracker:
-            progress_tracker.update(10, "Creating temporary audio mix with FFmpeg...")
-        temp_audio_path = create_audio_mix_ffmpeg(audio_files, total_video_duration, temp_audio_path)
+            progress_tracker.update(progress_start, "Creating audio mix and image slideshow concurrently with FFmpeg...")
         
-        if progress_tracker:
-            progress_tracker.update(30, "Creating temporary image slideshow with FFmpeg...")
-        temp_video_path = create_image_slideshow_ffmpeg(image_files, total_video_duration, temp_video_path)
+        # The two stages are independent until the merge, so run them side by side
+        # and kill the other stage's FFmpeg processes as soon as one of them fails
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            audio_future = executor.submit(create_audio_mix_ffmpeg, audio_files, total_video_duration, temp_audio_path,
+                                           session, loop_crossfade)
+            video_future = executor.submit(create_image_slideshow_ffmpeg, image_files, total_video_duration, temp_video_path, session)
+            done, _ = wait([audio_future, video_future], return_when=FIRST_EXCEPTION)
+            failed = next((future for future in done if future.exception()), None)
+            if failed:
+                session.cancel()
+                raise failed.exception()
+        temp_audio_path = audio_future.result()
+        temp_video_path = video_future.result()
         
         if progress_tracker:
-            progress_tracker.update(70, "Merging audio and video streams with FFmpeg...")
+            progress_tracker.update(progress_start + (progress_end - progress_start) * 4 // 5,
+                                    "Merging audio and video streams with FFmpeg...")
         
         # Use FFmpeg to merge the temporary video and audio files
         print(f"🔧 Final merge FFmpeg command details:")
@@ -249,11 +1085,11 @@ def generate_video_ffmpeg(audio_files, image_files, final_videos_folder, total_v
         audio_stream = ffmpeg.input(temp_audio_path)
         video_stream = ffmpeg.input(temp_video_path)
         
-        (
+        run_ffmpeg(
             ffmpeg
-            .output(video_stream, audio_stream, final_video_path, vcodec='copy', acodec='copy')
-            .overwrite_output()
-            .run(cmd=['ffmpeg', '-y'], capture_stderr=True, quiet=True)
+            .output(video_stream, audio_stream, final_video_path, vcodec='copy', acodec='copy', t=total_video_duration)
+            .overwrite_output(),
+            session, 'merge', total_video_duration
         )
         
         # Verify the final output file was created
@@ -267,7 +1103,7 @@ def generate_video_ffmpeg(audio_files, image_files, final_videos_folder, total_v
         print(f"✅ Final video merge completed: {final_video_path} ({final_file_size} bytes)")
         
         if progress_tracker:
-            progress_tracker.update(100, "Video creation completed!")
+            progress_tracker.update(progress_end, "Video creation completed!")
         
         print(f"✅ Final video created successfully at: {final_video_path}")
         
@@ -282,36 +1118,122 @@ def generate_video_ffmpeg(audio_files, image_files, final_videos_folder, total_v
         print(f"❌ Error during video generation: {e}")
         raise
     finally:
+        if stage_metrics is not None:
+            stage_metrics.extend(session.get_stage_metrics())
         if CLEANUP_TEMP_FILES:
             cleanup_temp_files(temp_files_to_clean)
 
-def create_video_ffmpeg_optimized(total_video_duration, progress_tracker=None):
-    """Main function to create video with all optimizations using ffmpeg-python"""
+def generate_long_form_video_ffmpeg(audio_files, image_files, final_videos_folder, total_video_duration,
+                                    progress_tracker=None, stage_metrics=None, channel_name=None, output_path=None):
+    """Renders one seamless loop segment and repeats it with stream copy up to the full duration"""
+    # Whole images only, so the slideshow never cuts an image short at the seam
+    segment_duration = min(max(1, int(LOOP_SEGMENT_DURATION // IMAGE_DURATION)) * IMAGE_DURATION, total_video_duration)
+    print(f"🔁 Long-form mode: rendering a {segment_duration}s loop segment, "
+          f"repeated {total_video_duration / segment_duration:.1f}x to {total_video_duration}s")
+    
+    segment_path = generate_video_ffmpeg(
+        audio_files, plan_slideshow_images(image_files, segment_duration, channel_name), TEMP_FILES_FOLDER, segment_duration,
+        progress_tracker, stage_metrics, progress_range=(10, 90), loop_crossfade=LOOP_AUDIO_CROSSFADE
+    )
+    
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    final_video_path = output_path or os.path.join(final_videos_folder, f"video_{timestamp}.mp4")
+    session = RenderSession(progress_tracker, (90, 100))
+    session.set_stages({'loop': 1})
+    try:
+        if progress_tracker:
+            progress_tracker.update(90, "Repeating loop segment to full length with FFmpeg...")
+        run_ffmpeg(
+            ffmpeg
+            .input(segment_path, stream_loop=-1)
+            .output(final_video_path, vcodec='copy', acodec='copy', t=total_video_duration)
+            .overwrite_output(),
+            session, 'loop', total_video_duration
+        )
+        
+        if not os.path.exists(final_video_path) or os.path.getsize(final_video_path) == 0:
+            raise FileNotFoundError(f"Loop repetition completed but final video is missing or empty: {final_video_path}")
+        
+        if progress_tracker:
+            progress_tracker.update(100, "Video creation completed!")
+        print(f"✅ Final video created successfully at: {final_video_path}")
+        print(f"Video file size: {os.path.getsize(final_video_path) / (1024*1024):.2f} MB")
+        return final_video_path
+    except ffmpeg.Error as e:
+        print(f"❌ FFmpeg loop repetition failed:")
+        if hasattr(e, 'stderr') and e.stderr:
+            print(f"   Error details: {e.stderr.decode('utf8')}")
+        cleanup_temp_files([final_video_path])
+        raise
+    finally:
+        if stage_metrics is not None:
+            stage_metrics.extend(session.get_stage_metrics())
+        if CLEANUP_TEMP_FILES:
+            cleanup_temp_files([segment_path])
+
+def render_planned_video(audio_files, image_files, total_video_duration, progress_tracker=None, stage_metrics=None,
+                         channel_name=None, output_path=None):
+    """Plans and renders one video from the given libraries, in long-form mode past LONG_FORM_THRESHOLD"""
+    if LONG_FORM_THRESHOLD and total_video_duration >= LONG_FORM_THRESHOLD:
+        return generate_long_form_video_ffmpeg(
+            audio_files,
+            image_files,
+            FINAL_VIDEOS_FOLDER,
+            total_video_duration,
+            progress_tracker,
+            stage_metrics,
+            channel_name,
+            output_path
+        )
+    # Only the planned images are opened from here on, however large the library is
+    return generate_video_ffmpeg(
+        audio_files, 
+        plan_slideshow_images(image_files, total_video_duration, channel_name), 
+        FINAL_VIDEOS_FOLDER, 
+        total_video_duration,
+        progress_tracker,
+        stage_metrics,
+        output_path=output_path
+    )
+
+def create_video_ffmpeg_optimized(total_video_duration, progress_tracker=None, stage_metrics=None, channel_name=None,
+                                  music_folder=None, images_folder=None, output_path=None):
+    """Main function to create video with all optimizations using ffmpeg-python."""
     
     print(f"🚀 Starting optimized video creation for {total_video_duration} seconds...")
     start_time = time.time()
+    music_folder = music_folder or MUSIC_FOLDER
+    images_folder = images_folder or IMAGES_FOLDER
     
     try:
         # Debug directory paths
         print(f"🔍 Directory paths:")
         print(f"   BASE_DIR: {BASE_DIR}")
-        print(f"   MUSIC_FOLDER: {MUSIC_FOLDER}")
-        print(f"   IMAGES_FOLDER: {IMAGES_FOLDER}")
+        print(f"   MUSIC_FOLDER: {music_folder}")
+        print(f"   IMAGES_FOLDER: {images_folder}")
         print(f"   FINAL_VIDEOS_FOLDER: {FINAL_VIDEOS_FOLDER}")
         print(f"   TEMP_FILES_FOLDER: {TEMP_FILES_FOLDER}")
         
         ensure_directory_exists(TEMP_FILES_FOLDER)
         ensure_directory_exists(FINAL_VIDEOS_FOLDER)
         
-        # Verify directories exist and are writable
+        # Verify directories exist: source folders only need to be readable, and a
+        # write probe there would bump their mtime and force a media index rescan
         print(f"🔍 Directory verification:")
-        for dir_path, dir_name in [
-            (MUSIC_FOLDER, "Music"),
-            (IMAGES_FOLDER, "Images"), 
-            (TEMP_FILES_FOLDER, "Temp Files"),
-            (FINAL_VIDEOS_FOLDER, "Final Videos")
+        for dir_path, dir_name, needs_write in [
+            (music_folder, "Music", False),
+            (images_folder, "Images", False),
+            (TEMP_FILES_FOLDER, "Temp Files", True),
+            (FINAL_VIDEOS_FOLDER, "Final Videos", True)
         ]:
-            if os.path.exists(dir_path):
+            if not os.path.exists(dir_path):
+                print(f"   ❌ {dir_name}: {dir_path} (does not exist)")
+            elif not needs_write:
+                if os.access(dir_path, os.R_OK | os.X_OK):
+                    print(f"   ✅ {dir_name}: {dir_path} (readable)")
+                else:
+                    print(f"   ❌ {dir_name}: {dir_path} (not readable)")
+            else:
                 try:
                     # Test if directory is writable
                     test_file = os.path.join(dir_path, "test_write.tmp")
@@ -321,12 +1243,10 @@ def create_video_ffmpeg_optimized(total_video_duration, progress_tracker=None):
                     print(f"   ✅ {dir_name}: {dir_path} (writable)")
                 except Exception as e:
                     print(f"   ❌ {dir_name}: {dir_path} (not writable: {e})")
-            else:
-                print(f"   ❌ {dir_name}: {dir_path} (does not exist)")
         
         print("📁 Scanning for media files...")
-        audio_files = get_supported_files(MUSIC_FOLDER, AUDIO_EXTENSIONS)
-        image_files = get_supported_files(IMAGES_FOLDER, IMAGE_EXTENSIONS)
+        audio_files = get_media_files(music_folder, AUDIO_EXTENSIONS, 'audio')
+        image_files = get_media_files(images_folder, IMAGE_EXTENSIONS, 'image')
         
         if not audio_files:
             raise ValueError("No supported audio files found in the music folder")
@@ -335,18 +1255,24 @@ def create_video_ffmpeg_optimized(total_video_duration, progress_tracker=None):
         
         print(f"✅ Found {len(audio_files)} audio files and {len(image_files)} image files")
         
-        total_image_duration = len(image_files) * IMAGE_DURATION
-        if total_image_duration < total_video_duration:
-            print(f"⚠️  Warning: Image content ({total_image_duration}s) is shorter than requested duration ({total_video_duration}s)")
-            total_video_duration = total_image_duration
-        
-        final_video_path = generate_video_ffmpeg(
-            audio_files, 
-            image_files, 
-            FINAL_VIDEOS_FOLDER, 
-            total_video_duration,
-            progress_tracker
-        )
+        try:
+            final_video_path = render_planned_video(audio_files, image_files, total_video_duration, progress_tracker,
+                                                    stage_metrics, channel_name, output_path)
+        except Exception as e:
+            # An input deleted while rendering: rescan once and render from what is really there
+            missing = [file_path for file_path in audio_files + image_files if not os.path.exists(file_path)]
+            if not missing:
+                raise
+            print(f"⚠️  Render failed with {len(missing)} input file(s) gone ({e}), rescanning media folders and retrying...")
+            rescan_media_folders((music_folder, AUDIO_EXTENSIONS, 'audio'), (images_folder, IMAGE_EXTENSIONS, 'image'))
+            audio_files = [file_path for file_path in get_media_files(music_folder, AUDIO_EXTENSIONS, 'audio')
+                           if os.path.exists(file_path)]
+            image_files = [file_path for file_path in get_media_files(images_folder, IMAGE_EXTENSIONS, 'image')
+                           if os.path.exists(file_path)]
+            if not audio_files or not image_files:
+                raise
+            final_video_path = render_planned_video(audio_files, image_files, total_video_duration, progress_tracker,
+                                                    stage_metrics, channel_name, output_path)
         
         if not final_video_path or not os.path.exists(final_video_path) or os.path.getsize(final_video_path) == 0:
             raise ValueError("Video generation failed - no valid output file created")
@@ -355,6 +1281,10 @@ def create_video_ffmpeg_optimized(total_video_duration, progress_tracker=None):
         processing_time = end_time - start_time
         print(f"⏱️  Total processing time: {processing_time:.2f} seconds")
         print(f"📊 Processing speed: {total_video_duration/processing_time:.2f} seconds of video per second of processing")
+        for stage in stage_metrics or []:
+            print(f"   {stage['stage']}: {stage['wall_seconds']:.2f}s wall, {stage['cpu_seconds']:.2f}s CPU, "
+                  f"peak RSS {stage['peak_rss_bytes'] / (1024*1024):.0f} MB, "
+                  f"read {stage['read_bytes'] / (1024*1024):.1f} MB, written {stage['write_bytes'] / (1024*1024):.1f} MB")
         
         return final_video_path
         
@@ -364,11 +1294,220 @@ def create_video_ffmpeg_optimized(total_video_duration, progress_tracker=None):
         print(f"Error details: {traceback.format_exc()}")
         raise
 
+def get_batch_concurrency(job_count):
+    """Sizes the batch render pool from CPU count and currently available memory"""
+    cpu_slots = (os.cpu_count() or 1) // BATCH_CORES_PER_RENDER
+    memory_slots = psutil.virtual_memory().available // (1024 * 1024) // BATCH_MEMORY_PER_RENDER_MB
+    return max(1, min(job_count, cpu_slots, memory_slots))
+
+def normalize_batch_job(job):
+    """Turns a duration or a job spec dict into a job spec dict with a 'duration' key"""
+    if isinstance(job, dict):
+        if 'duration' not in job:
+            raise ValueError(f"Batch job is missing 'duration': {job}")
+        return dict(job)
+    return {'duration': job}
+
+def render_batch_job(job):
+    """Renders one batch job and returns its result record instead of raising"""
+    options = dict(job)
+    duration = options.pop('duration')
+    stage_metrics = []
+    start_time = time.time()
+    try:
+        video_path = create_video_ffmpeg_optimized(duration, stage_metrics=stage_metrics, **options)
+        error = None
+    except Exception as e:
+        video_path = None
+        error = str(e)
+    return {'job': job, 'video_path': video_path, 'error': error, 'elapsed': time.time() - start_time,
+            'stages': stage_metrics}
+
+def create_videos_batch(jobs, max_workers=None):
+    """Renders many videos (durations or job dicts) with bounded parallelism and yields results as they finish"""
+    jobs = [normalize_batch_job(job) for job in jobs]
+    if not jobs:
+        return
+
+    max_workers = max_workers or get_batch_concurrency(len(jobs))
+    print(f"🚀 Starting batch of {len(jobs)} videos with {max_workers} concurrent renders...")
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(render_batch_job, job): index for index, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            result = future.result()
+            result['index'] = futures[future]
+            yield result
+
+def parse_bitrate(bitrate):
+    """Converts an FFmpeg bitrate such as '256k' to bits per second"""
+    multipliers = {'k': 1000, 'm': 1000000}
+    suffix = bitrate[-1].lower()
+    if suffix in multipliers:
+        return float(bitrate[:-1]) * multipliers[suffix]
+    return float(bitrate)
+
+def tune_encoder_settings(uplink_mbps, target_duration=TUNING_TARGET_DURATION, sample_duration=TUNING_SAMPLE_DURATION,
+                          presets=TUNING_PRESETS, crfs=TUNING_CRFS, base_profile=None):
+    """Picks the x264 preset and CRF minimizing estimated encode plus upload time and saves them as 'tuned'"""
+    base_profile = base_profile or (ENCODING_PROFILE if ENCODING_PROFILE != 'tuned' else 'default')
+    ensure_directory_exists(TEMP_FILES_FOLDER)
+    
+    image_files = get_supported_files(IMAGES_FOLDER, IMAGE_EXTENSIONS)
+    if not image_files:
+        raise ValueError("No supported image files found in the images folder")
+    sample_images = plan_slideshow_images(image_files, sample_duration, record=False)
+    sample_images, needs_scaling = prepare_image_sources(sample_images)
+    
+    sample_list_path = write_image_concat_list(sample_images, os.path.join(TEMP_FILES_FOLDER, "tuning_images.txt"))
+    sample_path = os.path.join(TEMP_FILES_FOLDER, "tuning_sample.mp4")
+    audio_bps = parse_bitrate(AUDIO_BITRATE)
+    uplink_bps = uplink_mbps * 1000000
+    
+    print(f"🎛️  Tuning encoder on a {sample_duration}s sample for {target_duration}s videos at {uplink_mbps} Mbit/s uplink...")
+    results = []
+    try:
+        for preset in presets:
+            for crf in crfs:
+                encoder_args = dict(get_video_encoder_args(base_profile), preset=preset, crf=crf)
+                start_time = time.time()
+                run_ffmpeg(
+                    build_slideshow_stream(sample_list_path, sample_duration, needs_scaling)
+                    .output(sample_path, **encoder_args)
+                    .overwrite_output()
+                )
+                encode_time = time.time() - start_time
+                video_bps = os.path.getsize(sample_path) * 8 / sample_duration
+                
+                estimated_encode = target_duration * encode_time / sample_duration
+                estimated_upload = (video_bps + audio_bps) * target_duration / uplink_bps
+                result = {
+                    'preset': preset,
+                    'crf': crf,
+                    'encode_fps': sample_duration * encoder_args['r'] / encode_time,
+                    'video_kbps': video_bps / 1000,
+                    'estimated_encode_seconds': estimated_encode,
+                    'estimated_upload_seconds': estimated_upload,
+                    'estimated_total_seconds': estimated_encode + estimated_upload,
+                }
+                results.append(result)
+                print(f"   {preset:>10} crf {crf:>2}: {result['encode_fps']:7.1f} fps, {result['video_kbps']:7.0f} kbit/s -> "
+                      f"encode {estimated_encode:7.0f}s + upload {estimated_upload:7.0f}s = {result['estimated_total_seconds']:7.0f}s")
+    finally:
+        cleanup_temp_files([sample_list_path, sample_path])
+    
+    best = min(results, key=lambda result: result['estimated_total_seconds'])
+    print(f"🏆 Best setting: preset {best['preset']}, crf {best['crf']} "
+          f"({best['estimated_total_seconds']:.0f}s estimated per {target_duration}s video)")
+    
+    save_tuned_profile({
+        'base_profile': base_profile,
+        'preset': best['preset'],
+        'crf': best['crf'],
+        'uplink_mbps': uplink_mbps,
+        'target_duration': target_duration,
+        'estimated_total_seconds': best['estimated_total_seconds'],
+        'tuned_at': datetime.datetime.now().isoformat(timespec='seconds'),
+    })
+    return best, results
+
+def get_configured_media_folders():
+    """Returns the music and image folders of the default library and of every configured channel"""
+    music_folders = [MUSIC_FOLDER]
+    images_folders = [IMAGES_FOLDER]
+    channels = []
+    try:
+        if os.path.exists(CONFIG_FILE):
+            with open(CONFIG_FILE, 'r') as f:
+                channels = json.load(f).get('channels') or []
+    except Exception as e:
+        print(f"Warning: Could not read channel media folders from the config: {e}")
+    for channel in channels:
+        if isinstance(channel, dict):
+            if channel.get('music_folder'):
+                music_folders.append(channel['music_folder'])
+            if channel.get('images_folder'):
+                images_folders.append(channel['images_folder'])
+    return list(dict.fromkeys(music_folders)), list(dict.fromkeys(images_folders))
+
+def warm_media_caches(max_workers=None):
+    """Indexes, probes and pre-normalizes every configured library ahead of renders and prunes stale cache entries"""
+    start_time = time.time()
+    music_folders, images_folders = get_configured_media_folders()
+    if USE_MEDIA_INDEX:
+        for folder_path, extensions, kind in ([(folder, AUDIO_EXTENSIONS, 'audio') for folder in music_folders]
+                                              + [(folder, IMAGE_EXTENSIONS, 'image') for folder in images_folders]):
+            summary = scan_folder(folder_path, kind, extensions, max_workers)
+            print(f"✅ Media index: {summary['total']} {kind} files in {folder_path}, "
+                  f"{summary['updated']} updated, {summary['removed']} removed")
+    
+    audio_files = [file for folder in music_folders for file in get_supported_files(folder, AUDIO_EXTENSIONS)]
+    probed, failed = warm_probe_cache(audio_files, max_workers)
+    print(f"✅ Probe cache warm: {len(audio_files)} audio files, {probed} newly probed, {failed} failed "
+          f"in {time.time() - start_time:.2f} seconds")
+    if USE_AUDIO_CACHE:
+        removed = prune_audio_cache(audio_files, AUDIO_BITRATE, AUDIO_SAMPLE_RATE)
+        print(f"✅ Audio cache: {removed} stale entries removed")
+    
+    if USE_IMAGE_CACHE:
+        image_files = [file for folder in images_folders for file in get_supported_files(folder, IMAGE_EXTENSIONS)]
+        normalize_images(image_files, OUTPUT_RESOLUTION, max_workers)
+        removed = prune_image_cache(image_files, OUTPUT_RESOLUTION)
+        print(f"✅ Image cache warm: {len(image_files)} images at {OUTPUT_RESOLUTION[0]}x{OUTPUT_RESOLUTION[1]}, "
+              f"{removed} stale entries removed in {time.time() - start_time:.2f} seconds")
+        if USE_SEGMENT_CACHE:
+            removed = prune_segment_cache(image_files, OUTPUT_RESOLUTION, IMAGE_DURATION, get_video_encoder_args())
+            print(f"✅ Segment cache: {removed} stale entries removed")
+
 if __name__ == "__main__":
-    progress_tracker = VideoProgressTracker()
+    parser = argparse.ArgumentParser(description="Create slideshow videos with FFmpeg")
+    subparsers = parser.add_subparsers(dest='command')
+    render_parser = subparsers.add_parser('render', help="Render a single video (default)")
+    render_parser.add_argument('duration', type=int, nargs='?', default=300, help="Video duration in seconds")
+    render_parser.add_argument('--profile', choices=list(ENCODING_PROFILES), help="Encoding profile")
+    render_parser.add_argument('--channel', default=None, help="Channel whose image history the slideshow avoids repeating")
+    warm_parser = subparsers.add_parser('warm-cache', help="Index, probe and pre-normalize the whole media library in parallel")
+    warm_parser.add_argument('--workers', type=int, default=None, help="Parallel ffprobe processes (default: CPU count)")
+    batch_parser = subparsers.add_parser('batch', help="Render many videos with bounded parallelism")
+    batch_parser.add_argument('durations', type=int, nargs='*', help="Video durations in seconds")
+    batch_parser.add_argument('--jobs-file', help="JSON file with a list of durations or job specs")
+    batch_parser.add_argument('--workers', type=int, default=None, help="Concurrent renders (default: sized from CPU and memory)")
+    batch_parser.add_argument('--profile', choices=list(ENCODING_PROFILES), help="Encoding profile")
+    tune_parser = subparsers.add_parser('tune', help="Pick encoder preset/CRF minimizing encode plus upload time")
+    tune_parser.add_argument('--uplink-mbps', type=float, default=None, help="Upload speed in Mbit/s (default: 'uplink_mbps' from the config)")
+    tune_parser.add_argument('--target-duration', type=int, default=TUNING_TARGET_DURATION, help="Video length to optimize for, in seconds")
+    tune_parser.add_argument('--sample-duration', type=int, default=TUNING_SAMPLE_DURATION, help="Length of the tuning sample, in seconds")
+    tune_parser.add_argument('--profile', choices=list(ENCODING_PROFILES), help="Base encoding profile to tune")
+    args = parser.parse_args()
     
     try:
-        # Create a 5-minute (300 seconds) video
-        create_video_ffmpeg_optimized(300, progress_tracker)
+        if getattr(args, 'profile', None):
+            set_encoding_profile(args.profile)
+        
+        if args.command == 'warm-cache':
+            warm_media_caches(args.workers)
+        elif args.command == 'tune':
+            uplink_mbps = args.uplink_mbps
+            if uplink_mbps is None:
+                with open(CONFIG_FILE, 'r') as f:
+                    uplink_mbps = json.load(f).get('uplink_mbps', 20)
+            tune_encoder_settings(uplink_mbps, args.target_duration, args.sample_duration, base_profile=args.profile)
+        elif args.command == 'batch':
+            jobs = list(args.durations)
+            if args.jobs_file:
+                with open(args.jobs_file, 'r') as f:
+                    jobs.extend(json.load(f))
+            failures = 0
+            for result in create_videos_batch(jobs, args.workers):
+                if result['error']:
+                    failures += 1
+                    print(f"❌ Job {result['index'] + 1} failed after {result['elapsed']:.2f}s: {result['error']}")
+                else:
+                    print(f"✅ Job {result['index'] + 1} finished in {result['elapsed']:.2f}s: {result['video_path']}")
+            print(f"📊 Batch finished: {len(jobs) - failures} succeeded, {failures} failed")
+        else:
+            progress_tracker = VideoProgressTracker()
+            # Create a 5-minute (300 seconds) video unless another duration is given
+            create_video_ffmpeg_optimized(getattr(args, 'duration', 300), progress_tracker,
+                                          channel_name=getattr(args, 'channel', None))
     except Exception as e:
         print(f"Error: {e}")
\ No newline at end of file
@@ -0,0 +1,330 @@
+# Filename: automate/pipeline.py
+
+import os
+import json
+import time
+import threading
+from datetime import datetime
+from functions.mixCreate import create_video_ffmpeg_optimized, FINAL_VIDEOS_FOLDER
+from automate.auto import upload_video_file, get_upload_session, QuotaExceededError
+from automate.jobLedger import JobLedger, PLANNED, RENDERING, RENDERED, UPLOADING, UPLOADED, FAILED
+
+# Default worker limits; renders are CPU bound, uploads are bound by the uplink
+RENDER_WORKERS = 1
+UPLOAD_WORKERS = 1
+# Rendered videos allowed to wait for upload before renders pause, so disk use stays bounded;
+# videos waiting for the upload window or for quota do not count, so a backlog can build up for the next window
+MAX_PENDING_UPLOADS = 2
+# Failed uploads are retried (resuming the saved upload session) before a job is marked failed
+MAX_UPLOAD_ATTEMPTS = 3
+# Seconds a failed upload waits before its next attempt, doubled after every further failure
+UPLOAD_RETRY_DELAY = 60
+# Seconds idle workers wait before polling the ledger again
+POLL_INTERVAL = 1
+
+def normalize_channel_config(channel, defaults=None):
+    """Fills a channel config section with defaults.
+
+    Keys: name (required), video_duration, max_videos, cycle_delay (seconds
+    between the end of one render of the channel and the start of its next),
+    weight (share of the pools relative to other channels), music_folder,
+    images_folder and credentials_file (None means the shared defaults).
+    """
+    if isinstance(channel, str):
+        channel = {'name': channel}
+    if not channel.get('name'):
+        raise ValueError(f"Channel config is missing 'name': {channel}")
+    spec = {
+        'video_duration': None,
+        'max_videos': 1,
+        'cycle_delay': 0,
+        'weight': 1,
+        'music_folder': None,
+        'images_folder': None,
+        'credentials_file': None,
+    }
+    spec.update(defaults or {})
+    spec.update({key: value for key, value in channel.items() if value is not None})
+    if not spec['video_duration']:
+        raise ValueError(f"Channel '{spec['name']}' has no video_duration")
+    spec['weight'] = max(spec['weight'], 0.001)
+    return spec
+
+class VideoPipeline:
+    """Producer/consumer pipeline: render workers fill the job ledger, upload workers drain it.
+
+    Both sides run concurrently with their own worker limits, so a video uploads
+    while the next one renders. Any number of channels share the two pools; each
+    free worker serves the eligible channel with the smallest weighted share of
+    work so far, so a busy channel cannot starve the others. Workers follow the
+    controller: they idle while it is paused and finish their current step and
+    exit once it stops. With an UploadScheduler, uploads only start inside its
+    upload window and for channels whose API projects have quota left; the
+    rest wait as rendered videos instead of failing. With a BandwidthShaper all
+    concurrent uploads share its bandwidth budget fairly.
+    """
+    def __init__(self, controller, channels, progress_tracker=None,
+                 render_workers=RENDER_WORKERS, upload_workers=UPLOAD_WORKERS,
+                 max_pending_uploads=MAX_PENDING_UPLOADS, on_record=None, ledger=None, scheduler=None,
+                 shaper=None):
+        self.controller = controller
+        self.channels = {}
+        for channel in channels:
+            spec = normalize_channel_config(channel)
+            self.channels[spec['name']] = spec
+        if not self.channels:
+            raise ValueError("No channels configured")
+        self.progress_tracker = progress_tracker
+        self.render_workers = max(1, render_workers)
+        self.upload_workers = max(1, upload_workers)
+        self.max_pending_uploads = max(1, max_pending_uploads)
+        self.on_record = on_record
+        self.ledger = ledger or JobLedger()
+        self.scheduler = scheduler
+        self.shaper = shaper
+        self.lock = threading.Lock()
+        self.jobs_started = 0
+        self.renders_active = 0
+        self.results = []
+        # Per-channel counters driving fair share and cadence
+        self.channel_state = {
+            name: {'started': 0, 'uploads': 0, 'next_render_at': 0}
+            for name in self.channels
+        }
+
+    def _wait_while_paused(self):
+        while self.controller.running and self.controller.paused:
+            time.sleep(POLL_INTERVAL)
+        return self.controller.running
+
+    def _emit(self, record):
+        if self.on_record:
+            try:
+                self.on_record(record)
+            except Exception as e:
+                print(f"Warning: Could not record pipeline job: {e}")
+
+    def _channel_state(self, channel_name):
+        # Jobs recovered from an earlier run may belong to channels no longer configured
+        return self.channel_state.setdefault(channel_name, {'started': 0, 'uploads': 0, 'next_render_at': 0})
+
+    def _share(self, channel_name, counter):
+        weight = self.channels[channel_name]['weight'] if channel_name in self.channels else 1
+        return self._channel_state(channel_name)[counter] / weight
+
+    def _pick_fairly(self, candidates, counter):
+        """Returns the candidate job whose channel has the smallest weighted share so far"""
+        return min(candidates, key=lambda job: (self._share(job['channel'], counter), job['id']))
+
+    def _can_start_upload(self, job):
+        # Resumable uploads need no new quota, so they may continue on exhausted channels too
+        return self.scheduler.can_upload(job['channel']) or self._get_resumed_project(job) is not None
+
+    def _pick_upload_job(self, candidates):
+        if self.scheduler:
+            candidates = [job for job in candidates if self._can_start_upload(job)]
+        return self._pick_fairly(candidates, 'uploads') if candidates else None
+
+    def _count_pending_uploads(self):
+        """Counts the rendered videos that hold back renders: uploading ones and those that could upload now.
+
+        Videos waiting for the upload window or for quota are not counted, so
+        renders keep filling the backlog (up to each channel's max_videos) until
+        uploads can run again.
+        """
+        if not self.scheduler:
+            return self.ledger.count(RENDERED, UPLOADING)
+        pending = self.ledger.count(UPLOADING)
+        if self.scheduler.in_upload_window():
+            pending += sum(1 for job in self.ledger.find_jobs((RENDERED,)) if self._can_start_upload(job))
+        return pending
+
+    def _claim_render_job(self):
+        """Takes the next render job, enqueueing one for the most underserved eligible channel"""
+        with self.lock:
+            if self._count_pending_uploads() + self.renders_active >= self.max_pending_uploads:
+                return None
+            # The output path is recorded before rendering starts, so a crash never leaves an untracked file
+            video_path = os.path.join(FINAL_VIDEOS_FOLDER, f"video_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.mp4")
+            job = self.ledger.claim(PLANNED, RENDERING, lambda candidates: self._pick_fairly(candidates, 'started'),
+                                    video_path=video_path)
+            if job is None:
+                now = time.time()
+                eligible = [name for name, spec in self.channels.items()
+                            if self.channel_state[name]['started'] < spec['max_videos']
+                            and self.channel_state[name]['next_render_at'] <= now]
+                if not eligible:
+                    return None
+                channel_name = min(eligible, key=lambda name: self._share(name, 'started'))
+                self.ledger.plan(channel_name, self.channels[channel_name]['video_duration'])
+                job = self.ledger.claim(PLANNED, RENDERING, video_path=video_path)
+            self.jobs_started += 1
+            self.renders_active += 1
+            self._channel_state(job['channel'])['started'] += 1
+            self.controller.cycle_count = self.jobs_started
+            job['cycle'] = self.jobs_started
+            return job
+
+    def render_worker(self):
+        while self._wait_while_paused():
+            job = self._claim_render_job()
+            if job is None:
+                if self._renders_exhausted():
+                    break
+                time.sleep(POLL_INTERVAL)
+                continue
+
+            spec = self.channels.get(job['channel'], {})
+            stage_metrics = []
+            record = {
+                'job': job['id'],
+                'cycle': job['cycle'],
+                'channel': job['channel'],
+                'duration': job['duration'],
+                'started_at': datetime.now().isoformat(timespec='seconds'),
+                'stages': stage_metrics,
+            }
+            print(f"🎬 Rendering job {job['id']} ({job['duration']}s) for '{job['channel']}'")
+            render_start = time.time()
+            try:
+                record['video_path'] = create_video_ffmpeg_optimized(
+                    job['duration'], self.progress_tracker, stage_metrics, channel_name=job['channel'],
+                    music_folder=spec.get('music_folder'), images_folder=spec.get('images_folder'),
+                    output_path=job['video_path'])
+                record['render_seconds'] = time.time() - render_start
+                self.ledger.transition(job['id'], RENDERING, RENDERED, video_path=record['video_path'],
+                                       record=json.dumps(record))
+            except Exception as e:
+                record['render_seconds'] = time.time() - render_start
+                record['render_error'] = str(e)
+                self.ledger.transition(job['id'], RENDERING, FAILED, error=str(e), record=json.dumps(record))
+                self._finish(record)
+            finally:
+                with self.lock:
+                    self.renders_active -= 1
+                    self._channel_state(job['channel'])['next_render_at'] = time.time() + spec.get('cycle_delay', 0)
+
+    def _renders_exhausted(self):
+        with self.lock:
+            budget_left = any(self.channel_state[name]['started'] < spec['max_videos']
+                              for name, spec in self.channels.items())
+            return not budget_left and self.ledger.count(PLANNED) == 0
+
+    def _get_resumed_project(self, job):
+        """Returns the project of an earlier attempt whose upload session can be resumed, or None.
+
+        A resumed session sends no new videos.insert, so it needs no new quota,
+        and it continues with the credentials the session was opened with.
+        """
+        session = get_upload_session(job['video_path'])
+        if not session or not session.get('resumable_uri'):
+            return None
+        return self.scheduler.projects.get(job['api_project'])
+
+    def _assign_upload_project(self, job):
+        # Runs inside the claim, so the project is in the ledger before any byte is sent
+        project = self._get_resumed_project(job) or self.scheduler.reserve(job['channel'])
+        if project is None:
+            # Another worker took the last quota in the meantime
+            return None
+        return {'api_project': project['name']}
+
+    def upload_worker(self):
+        while self._wait_while_paused():
+            # Checked before claiming, so a render finishing in between is not missed
+            with self.lock:
+                renders_done = self.renders_active == 0
+            renders_done = renders_done and self._renders_exhausted()
+            job = None
+            if not self.scheduler or self.scheduler.in_upload_window():
+                with self.lock:
+                    job = self.ledger.claim(RENDERED, UPLOADING, self._pick_upload_job,
+                                            self._assign_upload_project if self.scheduler else None)
+                    if job is not None:
+                        self._channel_state(job['channel'])['uploads'] += 1
+            if job is None:
+                if renders_done and self.ledger.count(RENDERED) == 0:
+                    break
+                time.sleep(POLL_INTERVAL)
+                continue
+
+            spec = self.channels.get(job['channel'], {})
+            record = json.loads(job['record']) if job['record'] else {'job': job['id'], 'channel': job['channel']}
+            credentials_file = spec.get('credentials_file')
+            client_secrets_file = None
+            publish_at = None
+            project = None
+            if self.scheduler:
+                project = self.scheduler.projects[job['api_project']]
+                credentials_file = self.scheduler.get_credentials_file(job['channel'], project)
+                client_secrets_file = project['client_secrets_file']
+                publish_at = self.scheduler.assign_publish_at(job)
+
+            print(f"📤 Uploading job {job['id']} to '{job['channel']}': {job['video_path']}")
+            self.controller.update_status(f"Uploading {os.path.basename(job['video_path'])} to {job['channel']}...")
+            upload_start = time.time()
+            try:
+                uploaded_video = upload_video_file(job['channel'], job['video_path'], credentials_file,
+                                                   delete_after_upload=False, publish_at=publish_at,
+                                                   client_secrets_file=client_secrets_file, shaper=self.shaper)
+            except QuotaExceededError as e:
+                print(f"⛔ Upload of job {job['id']} hit the quota limit: {e}")
+                uploaded_video = None
+                if project:
+                    self.scheduler.mark_exhausted(project['name'])
+                    # Not the video's fault: it waits for quota without using up an attempt
+                    self.ledger.transition(job['id'], UPLOADING, RENDERED)
+                    continue
+            except Exception as e:
+                print(f"❌ Upload of job {job['id']} failed: {e}")
+                uploaded_video = None
+            attempts = job['upload_attempts'] + 1
+            record['upload_seconds'] = record.get('upload_seconds', 0) + time.time() - upload_start
+            record['upload_success'] = uploaded_video is not None
+            record['upload_attempts'] = attempts
+            if project:
+                record['api_project'] = project['name']
+            if publish_at:
+                record['publish_at'] = publish_at
+            if uploaded_video:
+                record['video_id'] = uploaded_video['id']
+                self.ledger.transition(job['id'], UPLOADING, UPLOADED, video_id=uploaded_video['id'],
+                                       upload_attempts=attempts, record=json.dumps(record))
+                try:
+                    self.ledger.clean_job(job)
+                except Exception as e:
+                    # recover() retries the cleanup on the next start
+                    print(f"Warning: Could not clean up job {job['id']}: {e}")
+            elif attempts < MAX_UPLOAD_ATTEMPTS:
+                # Back to the ledger after a backoff, so a short outage cannot use up every attempt;
+                # the saved upload session lets the next attempt resume
+                delay = UPLOAD_RETRY_DELAY * 2 ** (attempts - 1)
+                print(f"🔁 Retrying upload of job {job['id']} in {delay}s (attempt {attempts + 1}/{MAX_UPLOAD_ATTEMPTS})")
+                self.ledger.transition(job['id'], UPLOADING, RENDERED, upload_attempts=attempts,
+                                       not_before=time.time() + delay, record=json.dumps(record))
+                continue
+            else:
+                self.ledger.transition(job['id'], UPLOADING, FAILED, error="upload failed", upload_attempts=attempts,
+                                       record=json.dumps(record))
+            self._finish(record)
+
+    def _finish(self, record):
+        with self.lock:
+            self.results.append(record)
+        self._emit(record)
+
+    def run(self):
+        """Runs all workers until every channel's videos are rendered and uploaded or the controller stops.
+
+        Returns one record per finished job.
+        """
+        self.ledger.recover()
+        threads = [threading.Thread(target=self.render_worker, name=f"render-{index}", daemon=True)
+                   for index in range(self.render_workers)]
+        threads += [threading.Thread(target=self.upload_worker, name=f"upload-{index}", daemon=True)
+                    for index in range(self.upload_workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.results
@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from functions import mediaCache, mediaIndex, mixCreate
+
+
+def fake_describe_file(file_path, kind):
+    stat = os.stat(file_path)
+    return {
+        'path': os.path.abspath(file_path), 'folder': os.path.dirname(os.path.abspath(file_path)), 'kind': kind,
+        'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'content_hash': None,
+        'duration': 180.0 if kind == 'audio' else None, 'codec': None, 'width': None, 'height': None,
+        'sample_rate': None, 'channels': None, 'indexed_at': time.time(),
+    }
+
+
+def fake_render(audio_files, image_files, total, progress_tracker=None, stage_metrics=None, channel_name=None,
+                output_path=None):
+    output_path = os.path.join(mixCreate.FINAL_VIDEOS_FOLDER, "video.mp4")
+    with open(output_path, 'wb') as f:
+        f.write(b"video")
+    return output_path
+
+
+class RenderRescanTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.music_folder = os.path.join(self.root, "music")
+        self.images_folder = os.path.join(self.root, "images")
+        for folder, name in ((self.music_folder, "track.mp3"), (self.images_folder, "image.jpg")):
+            os.makedirs(folder)
+            with open(os.path.join(folder, name), 'wb') as f:
+                f.write(b"media")
+
+        patches = [
+            mock.patch.object(mediaIndex, 'MEDIA_INDEX_FILE', os.path.join(self.root, "media_index.db")),
+            mock.patch.object(mediaIndex, 'describe_file', fake_describe_file),
+            mock.patch.object(mediaCache, 'probe_cache', mock.Mock()),
+            mock.patch.object(mediaCache, 'content_hash_cache', mock.Mock()),
+            mock.patch.object(mixCreate, 'USE_MEDIA_INDEX', True),
+            mock.patch.object(mixCreate, 'TEMP_FILES_FOLDER', os.path.join(self.root, "temp")),
+            mock.patch.object(mixCreate, 'FINAL_VIDEOS_FOLDER', os.path.join(self.root, "final")),
+            mock.patch.object(mixCreate, 'render_planned_video', fake_render),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        mediaIndex.reset_state()
+        self.addCleanup(mediaIndex.reset_state)
+        self.addCleanup(shutil.rmtree, self.root, True)
+
+    def render(self):
+        return mixCreate.create_video_ffmpeg_optimized(60, music_folder=self.music_folder,
+                                                       images_folder=self.images_folder)
+
+    def test_second_render_does_not_rescan(self):
+        with mock.patch.object(mediaIndex, 'scan_folder', wraps=mediaIndex.scan_folder) as scan_folder:
+            self.render()
+            self.assertEqual(scan_folder.call_count, 2)
+            source_mtimes = [os.stat(folder).st_mtime_ns for folder in (self.music_folder, self.images_folder)]
+
+            self.render()
+            self.assertEqual(scan_folder.call_count, 2)
+            self.assertEqual(source_mtimes,
+                             [os.stat(folder).st_mtime_ns for folder in (self.music_folder, self.images_folder)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,199 @@
+# Filename: automate/uploadScheduler.py
+
+import time
+import sqlite3
+import threading
+import datetime
+from automate.auto import CLIENT_SECRETS_FILE, get_credentials_file_path
+from automate.jobLedger import JOB_LEDGER_FILE
+
+# YouTube Data API defaults: 10,000 units per project and day, videos.insert is the expensive call
+DEFAULT_DAILY_QUOTA = 10000
+DEFAULT_INSERT_COST = 1600
+DEFAULT_PROJECT_NAME = 'default'
+
+# Scheduled videos get a slot at least this far in the future, so processing can finish first
+PUBLISH_LEAD_SECONDS = 30 * 60
+# How far ahead publish slots are searched, in days
+PUBLISH_HORIZON_DAYS = 366
+
+QUOTA_SCHEMA = """
+CREATE TABLE IF NOT EXISTS quota_usage (
+    project TEXT NOT NULL,
+    day TEXT NOT NULL,
+    units INTEGER NOT NULL,
+    PRIMARY KEY (project, day)
+);
+"""
+
+def get_quota_timezone():
+    """API quota resets at midnight Pacific Time"""
+    try:
+        from zoneinfo import ZoneInfo
+        return ZoneInfo("America/Los_Angeles")
+    except Exception:
+        # No tz database available (e.g. Windows without tzdata): assume standard time
+        return datetime.timezone(datetime.timedelta(hours=-8))
+
+def get_quota_day(now=None):
+    """Returns the quota day (YYYY-MM-DD, Pacific Time) a timestamp falls into"""
+    moment = datetime.datetime.fromtimestamp(now or time.time(), get_quota_timezone())
+    return moment.strftime("%Y-%m-%d")
+
+def parse_clock_time(value):
+    """Converts 'HH:MM' into a datetime.time"""
+    hours, _, minutes = value.partition(":")
+    return datetime.time(int(hours), int(minutes or 0))
+
+def format_publish_at(moment):
+    """Formats an aware datetime as the RFC 3339 UTC timestamp publishAt expects"""
+    return moment.astimezone(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def parse_publish_at(value):
+    return datetime.datetime.strptime(value, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=datetime.timezone.utc)
+
+def normalize_project_config(project):
+    """Fills an API project section: name, client_secrets_file and daily_quota"""
+    spec = {'name': DEFAULT_PROJECT_NAME, 'client_secrets_file': CLIENT_SECRETS_FILE, 'daily_quota': DEFAULT_DAILY_QUOTA}
+    spec.update({key: value for key, value in project.items() if value is not None})
+    return spec
+
+class UploadScheduler:
+    """Spreads uploads over API projects by daily quota and assigns scheduled publish times.
+
+    Quota units are reserved per project and Pacific-time day in the job ledger
+    database before each videos.insert. A channel uploads through the project
+    with the most quota left among the ones it is authorized for (its
+    'api_projects', default all). Channels with 'publish_times' ("HH:MM", local
+    time) upload privately with publishAt set to their next free slot, so uploads
+    can run whenever quota and the optional upload window allow.
+    """
+    def __init__(self, projects=None, channels=None, insert_cost=DEFAULT_INSERT_COST, upload_window=None,
+                 ledger=None, quota_file=JOB_LEDGER_FILE):
+        self.projects = {}
+        for project in projects or [{}]:
+            spec = normalize_project_config(project)
+            self.projects[spec['name']] = spec
+        self.channels = {channel['name']: channel for channel in channels or []}
+        self.insert_cost = insert_cost
+        self.upload_window = (tuple(parse_clock_time(value) for value in upload_window)
+                              if upload_window else None)
+        self.ledger = ledger
+        self.quota_file = quota_file
+        self.lock = threading.Lock()
+        # Separate from the quota lock: reserve() runs inside ledger claims, while
+        # publish slots are picked holding this lock and then read the ledger
+        self.publish_lock = threading.Lock()
+        connection = self._connect()
+        try:
+            connection.executescript(QUOTA_SCHEMA)
+        finally:
+            connection.close()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.quota_file, timeout=30)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def get_used_units(self, project_name, day=None):
+        connection = self._connect()
+        try:
+            row = connection.execute("SELECT units FROM quota_usage WHERE project = ? AND day = ?",
+                                     (project_name, day or get_quota_day())).fetchone()
+            return row['units'] if row else 0
+        finally:
+            connection.close()
+
+    def get_remaining_units(self, project_name):
+        return self.projects[project_name]['daily_quota'] - self.get_used_units(project_name)
+
+    def get_channel_projects(self, channel_name):
+        allowed = self.channels.get(channel_name, {}).get('api_projects')
+        return [name for name in self.projects if not allowed or name in allowed]
+
+    def select_project(self, channel_name):
+        """Returns the channel's project with the most quota left for one insert, or None"""
+        candidates = [(self.get_remaining_units(name), name) for name in self.get_channel_projects(channel_name)]
+        candidates = [candidate for candidate in candidates if candidate[0] >= self.insert_cost]
+        return self.projects[max(candidates)[1]] if candidates else None
+
+    def can_upload(self, channel_name):
+        return self.select_project(channel_name) is not None
+
+    def reserve(self, channel_name):
+        """Books one insert's quota in the best project for the channel and returns the project, or None"""
+        with self.lock:
+            project = self.select_project(channel_name)
+            if project is None:
+                return None
+            connection = self._connect()
+            try:
+                with connection:
+                    connection.execute(
+                        "INSERT INTO quota_usage (project, day, units) VALUES (?, ?, ?) "
+                        "ON CONFLICT (project, day) DO UPDATE SET units = units + excluded.units",
+                        (project['name'], get_quota_day(), self.insert_cost))
+            finally:
+                connection.close()
+            return project
+
+    def mark_exhausted(self, project_name):
+        """Records that the API rejected an upload for quota, so the project rests until the reset"""
+        with self.lock:
+            connection = self._connect()
+            try:
+                with connection:
+                    connection.execute(
+                        "INSERT INTO quota_usage (project, day, units) VALUES (?, ?, ?) "
+                        "ON CONFLICT (project, day) DO UPDATE SET units = MAX(units, excluded.units)",
+                        (project_name, get_quota_day(), self.projects[project_name]['daily_quota']))
+            finally:
+                connection.close()
+        print(f"⛔ API project '{project_name}' is out of quota until the next reset (midnight Pacific Time)")
+
+    def get_credentials_file(self, channel_name, project):
+        """Credentials of a channel for a project; the default project keeps the classic file name"""
+        if project['name'] == DEFAULT_PROJECT_NAME:
+            return self.channels.get(channel_name, {}).get('credentials_file') or get_credentials_file_path(channel_name)
+        return get_credentials_file_path(f"{channel_name}_{project['name']}")
+
+    def in_upload_window(self, now=None):
+        """Tells whether uploads may run now; a window like ("01:00", "07:00") may wrap midnight"""
+        if not self.upload_window:
+            return True
+        current = datetime.datetime.fromtimestamp(now or time.time()).time()
+        start, end = self.upload_window
+        if start <= end:
+            return start <= current < end
+        return current >= start or current < end
+
+    def assign_publish_at(self, job):
+        """Returns the job's publishAt, picking the channel's next free slot on first use.
+
+        Returns None for channels without publish_times, which publish immediately.
+        The slot is stored in the ledger so retries and resumed uploads keep it.
+        """
+        if job.get('publish_at'):
+            return job['publish_at']
+        publish_times = self.channels.get(job['channel'], {}).get('publish_times')
+        if not publish_times:
+            return None
+
+        with self.publish_lock:
+            earliest = datetime.datetime.now().astimezone() + datetime.timedelta(seconds=PUBLISH_LEAD_SECONDS)
+            latest = self.ledger.get_latest_publish_at(job['channel']) if self.ledger else None
+            if latest:
+                earliest = max(earliest, parse_publish_at(latest) + datetime.timedelta(seconds=1))
+
+            local_earliest = earliest.astimezone()
+            slots = sorted(parse_clock_time(value) for value in publish_times)
+            for day_offset in range(PUBLISH_HORIZON_DAYS):
+                day = local_earliest.date() + datetime.timedelta(days=day_offset)
+                for slot in slots:
+                    candidate = datetime.datetime.combine(day, slot).astimezone()
+                    if candidate >= earliest:
+                        publish_at = format_publish_at(candidate)
+                        if self.ledger:
+                            self.ledger.update(job['id'], publish_at=publish_at)
+                        return publish_at
+        raise ValueError(f"No publish slot found for channel '{job['channel']}'")